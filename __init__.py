@@ -1,11 +1,6 @@
-from .pipeline import Exec, Serial, Parallel, Node
-from .glue import lazy_py, main, lazy_shell, Lazy
-from .shared.constants import SameContainer
-from .image import Image, relpath
-from .data import pipeline as temp_data, user as perm_data
-from .util import env_bool
+import importlib
+
 from ._version import __version__, __sha1__
-from . import api, data
 
 __all__ = [
     "Exec",
@@ -25,3 +20,44 @@ __all__ = [
     "env_bool",
     "api",
 ]
+
+# Public names and the (module, attribute) they come from. They are imported on first
+# use so that `import conducto` stays fast, e.g. for worker processes that only run
+# one function and never touch most of these.
+_LAZY = {
+    "Exec": (".pipeline", "Exec"),
+    "Serial": (".pipeline", "Serial"),
+    "Parallel": (".pipeline", "Parallel"),
+    "Node": (".pipeline", "Node"),
+    "main": (".glue", "main"),
+    "lazy_py": (".glue", "lazy_py"),
+    "lazy_shell": (".glue", "lazy_shell"),
+    "Lazy": (".glue", "Lazy"),
+    "SameContainer": (".shared.constants", "SameContainer"),
+    "Image": (".image", "Image"),
+    "relpath": (".image", "relpath"),
+    "temp_data": (".data", "pipeline"),
+    "perm_data": (".data", "user"),
+    "env_bool": (".util", "env_bool"),
+    "api": (".api", None),
+    "data": (".data", None),
+}
+
+
+def __getattr__(name):
+    # Submodules, like `conducto.pipeline`, were also attributes when they were
+    # imported eagerly, so keep them reachable that way.
+    module_name, attr = _LAZY.get(name, ("." + name, None))
+    try:
+        module = importlib.import_module(module_name, __name__)
+    except ModuleNotFoundError as e:
+        if e.name != __name__ + module_name:
+            raise
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = module if attr is None else getattr(module, attr)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
@@ -3,7 +3,6 @@ import os.path
 import importlib.util
 import conducto as co
 from conducto.shared import constants
-from conducto.debug import debug, livedebug
 import asyncio
 
 
@@ -196,6 +195,10 @@ def main():
         "init",
         "migrate",
     ):
+        # Only imported here so that running a file, as workers do for every Exec
+        # node made from a Python function, doesn't pay for it.
+        from conducto.debug import debug, livedebug
+
         variables = {
             "show": show,
             "debug": debug,
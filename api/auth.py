@@ -1,11 +1,14 @@
+import contextlib
+import datetime
+import hashlib
 import json
+import threading
 import time
 import typing
 import getpass
 import os
 from .. import api
-from jose import jwt
-from conducto.shared import types as t, request_utils
+from conducto.shared import constants, file_utils, types as t, request_utils
 from http import HTTPStatus as hs
 from . import api_utils
 
@@ -42,10 +45,18 @@ class Auth:
         return data["AccessToken"] if data is not None else None
 
     def get_id_token(self, token: t.Token) -> typing.Optional[t.Token]:
+        cache = _AuthCache.get(self.config)
+        id_token = cache.lookup("id_token", token)
+        if id_token is not None:
+            return id_token
         headers = api_utils.get_auth_headers(token)
         response = request_utils.get(self.url + "/auth/idtoken", headers=headers)
         data = self._get_data(response)
-        return data["IdToken"]
+        id_token = data["IdToken"]
+        cache.store(
+            "id_token", token, id_token, self.get_unverified_claims(id_token)["exp"]
+        )
+        return id_token
 
     def get_identity_claims(self, token: t.Token) -> dict:
         id_token = self.get_id_token(token)
@@ -53,10 +64,18 @@ class Auth:
         return claims
 
     def get_credentials(self, token: t.Token) -> dict:
+        cache = _AuthCache.get(self.config)
+        data = cache.lookup("credentials", token)
+        if data is not None:
+            return data
         headers = api_utils.get_auth_headers(token)
         headers["Authorization"] = "Bearer {}".format(token)
         response = request_utils.get(self.url + "/auth/creds", headers=headers)
         data = self._get_data(response)
+        if data is not None:
+            cache.store(
+                "credentials", token, data, _parse_expiration(data.get("Expiration"))
+            )
         return data
 
     def get_token_from_shell(
@@ -69,8 +88,7 @@ class Auth:
     def get_unverified_claims(self, token: t.Token) -> dict:
         # Returns a dict of *unverified* claims decoded from token.
         # No validation is done. Requires no knowledge of aws resources.
-        claims = jwt.get_unverified_claims(token)
-        return claims
+        return _get_unverified_claims(token)
 
     def prompt_for_login(self) -> dict:
         print(f"Log in to Conducto. To register, visit {self.url}/app/")
@@ -189,4 +207,124 @@ class Auth:
         return t.Token(token)
 
 
+class _AuthCache:
+    """
+    Process-wide cache of the ID token and STS credentials for each token, kept
+    until shortly before they expire so that repeated calls don't go back to the
+    server. If enabled with CONDUCTO_AUTH_CACHE or the `auth_cache` option, it is
+    also saved to a file under ~/.conducto, readable only by the user, that other
+    processes share.
+    """
+
+    # Don't hand out anything that expires sooner than this.
+    EXPIRY_WINDOW_SECS = 15 * 60
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        # {kind: {hash of token: [value, expiration]}}
+        self._entries = {}
+
+    @classmethod
+    def get(cls, config) -> "_AuthCache":
+        with cls._instance_lock:
+            if cls._instance is None:
+                enabled = os.getenv("CONDUCTO_AUTH_CACHE") or config.get(
+                    "config", "auth_cache"
+                )
+                path = None
+                if t.Bool(enabled):
+                    path = os.path.join(
+                        constants.ConductoPaths.get_local_base_dir(), "auth_cache.json"
+                    )
+                cls._instance = cls(path)
+            return cls._instance
+
+    def lookup(self, kind, token):
+        key = hashlib.sha256(token.encode()).hexdigest()
+        with self._lock:
+            entry = self._entries.get(kind, {}).get(key)
+            if not self._is_fresh(entry) and self.path is not None:
+                # Another process may have saved a fresh one.
+                self._entries = self._merge(self._entries, self._read())
+                entry = self._entries.get(kind, {}).get(key)
+        return entry[0] if self._is_fresh(entry) else None
+
+    def _is_fresh(self, entry):
+        return entry is not None and entry[1] > time.time() + self.EXPIRY_WINDOW_SECS
+
+    def store(self, kind, token, value, expiration):
+        key = hashlib.sha256(token.encode()).hexdigest()
+        with self._lock:
+            self._entries.setdefault(kind, {})[key] = [value, expiration]
+            if self.path is not None:
+                self._write()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write(self):
+        # Merge with what other processes saved, drop anything expired, and replace
+        # the file atomically.
+        now = time.time()
+        entries = self._merge(self._read(), self._entries)
+        entries = {
+            kind: {k: v for k, v in d.items() if v[1] > now}
+            for kind, d in entries.items()
+        }
+        with contextlib.suppress(OSError):
+            with file_utils.atomic_write(self.path, "w") as f:
+                json.dump(entries, f)
+
+    @staticmethod
+    def _merge(old, new):
+        merged = {kind: dict(d) for kind, d in old.items()}
+        for kind, d in new.items():
+            merged.setdefault(kind, {}).update(d)
+        return merged
+
+
+_claims_cache = {}
+
+
+def _get_unverified_claims(token):
+    # Decoding is deterministic, so the claims of each token are remembered. Only a
+    # few tokens are live at a time; start over if that is ever not the case.
+    claims = _claims_cache.get(token)
+    if claims is None:
+        from jose import jwt
+
+        claims = jwt.get_unverified_claims(token)
+        if len(_claims_cache) >= 64:
+            _claims_cache.clear()
+        _claims_cache[token] = claims
+    return claims
+
+
+def _parse_expiration(expiration) -> float:
+    # Credentials may give their expiration as epoch seconds or an ISO 8601 string.
+    # If it's missing, assume the usual one hour lifetime.
+    if isinstance(expiration, (int, float)):
+        return float(expiration)
+    if isinstance(expiration, str):
+        try:
+            return float(expiration)
+        except ValueError:
+            pass
+        try:
+            return datetime.datetime.fromisoformat(
+                expiration.replace("Z", "+00:00")
+            ).timestamp()
+        except ValueError:
+            pass
+    return time.time() + 3600
+
+
 AsyncAuth = api_utils.async_helper(Auth)
@@ -1,9 +1,12 @@
+import contextlib
+import io
 import os
 import time
 import random
 import subprocess
+import threading
 import configparser
-from conducto.shared import constants, log
+from conducto.shared import constants, file_utils, log
 
 
 def is_home_dir(dirname):
@@ -75,6 +78,15 @@ class Config:
         LOCAL = "local"
         AWS = "aws"
 
+    # The parsed config file is shared by every Config, and only parsed again when
+    # the file's mtime, size or inode change. Instances copy it before modifying it.
+    # Values looked up in it are kept too, since ConfigParser.get() is slow.
+    # {path: (stat key, ConfigParser, {(section, key): value})}
+    _parsed = {}
+    _parsed_lock = threading.Lock()
+    # {(CONDUCTO_CONFIG, CONDUCTO_BASE_DIR, HOME, USERPROFILE): path}
+    _config_files = {}
+
     def __init__(self):
         self.reload()
 
@@ -83,16 +95,14 @@ class Config:
     ############################################################
     def reload(self):
         configFile = self.__get_config_file()
-        self.config = configparser.ConfigParser()
-        self.config.read(configFile)
+        self._load(configFile)
 
         # TODO: delete this convert chunk in May 2020
         if self.config.has_option("login", "token"):
             # convert old pre-profile format
             self._convert()
             # re-read
-            self.config = configparser.ConfigParser()
-            self.config.read(configFile)
+            self._load(configFile)
 
         if "CONDUCTO_PROFILE" in os.environ:
             self.default_profile = os.environ["CONDUCTO_PROFILE"]
@@ -101,6 +111,7 @@ class Config:
 
     def _convert(self):
         # TODO: remove in may 2020
+        self._own()
         url = self.config.get("cloud", "url", fallback="https://www.conducto.com")
         token = self.config.get("login", "token", fallback="__none__")
         if token != "__none__":
@@ -115,6 +126,9 @@ class Config:
             self.write()
 
             self.write_profile(url, token)
+            # Writing made the parser the shared one again, so copy it before the
+            # changes below.
+            self._own()
 
         if self.config.has_option("launch", "show_shell"):
             self.config.set(
@@ -136,9 +150,18 @@ class Config:
         self.write()
 
     def get(self, section, key, default=None):
-        return self.config.get(section, key, fallback=default)
+        values = self._values
+        if values is None:
+            return self.config.get(section, key, fallback=default)
+        try:
+            value = values[section, key]
+        except KeyError:
+            value = self.config.get(section, key, fallback=_MISSING)
+            values[section, key] = value
+        return default if value is _MISSING else value
 
     def set(self, section, key, value, write=True):
+        self._own()
         if section not in self.config:
             self.config[section] = {}
         self.config[section][key] = value
@@ -157,6 +180,7 @@ class Config:
 
         required = ["url", "org_id", "email", "token"]
         if all(self.config.has_option(profile, rq) for rq in required):
+            self._own()
             self.config.remove_section(profile)
             self.write()
         else:
@@ -164,6 +188,7 @@ class Config:
             raise RuntimeError(msg)
 
     def delete(self, section, key, write=True):
+        self._own()
         del self.config[section][key]
         if not self.config[section]:
             del self.config[section]
@@ -216,8 +241,7 @@ commands:
                     raise RuntimeError(fallback_error)
             else:
                 os.mkdir(config_dir)
-        with open(config_file, "w") as config_fh:
-            self.config.write(config_fh)
+        self._write_atomic(config_file)
 
     ############################################################
     # specific methods
@@ -257,6 +281,7 @@ commands:
 
     def write_profile(self, url, token, default=True):
         # ensure that [general] section is first for readability
+        self._own()
         if not self.config.has_section("general"):
             self.config.add_section("general")
 
@@ -317,9 +342,127 @@ commands:
     ############################################################
     # helper methods
     ############################################################
+    def _load(self, config_file):
+        key = self._stat_key(config_file)
+        with Config._parsed_lock:
+            cached = Config._parsed.get(config_file)
+        if cached is None or cached[0] != key:
+            parser = configparser.ConfigParser()
+            parser.read(config_file)
+            cached = (key, parser, {})
+            with Config._parsed_lock:
+                Config._parsed[config_file] = cached
+        _key, self.config, self._values = cached
+        self._shared = True
+        # What the file held before this instance changed anything, so that only
+        # its own changes are written over what other processes wrote since.
+        self._base = None
+
+    def _own(self):
+        # Copy the shared parser before the first change to it.
+        if self._shared:
+            self._values = None
+            self._base = _snapshot(self.config)
+            buf = io.StringIO()
+            self.config.write(buf)
+            parser = configparser.ConfigParser()
+            parser.read_string(buf.getvalue())
+            self.config = parser
+            self._shared = False
+
+    def _write_atomic(self, config_file):
+        # Write to a temp file and rename it over the config, so readers never see a
+        # partial file. Under the lock, apply this instance's changes to the file as
+        # it is now, so that concurrent writers don't undo each other's changes.
+        path = os.path.realpath(config_file)
+        try:
+            perms = os.stat(path).st_mode & 0o7777
+        except FileNotFoundError:
+            perms = None
+        with _lock_file(path + ".lock"):
+            parser = configparser.ConfigParser()
+            parser.read(path)
+            if self._base is not None:
+                _apply_changes(parser, self._base, _snapshot(self.config))
+            with file_utils.atomic_write(path, "w", perms=perms) as config_fh:
+                parser.write(config_fh)
+            stat_key = self._stat_key(config_file)
+        # What was just written is now the shared copy.
+        with Config._parsed_lock:
+            Config._parsed[config_file] = (stat_key, parser, {})
+        self._load(config_file)
+
+    @staticmethod
+    def _stat_key(config_file):
+        try:
+            st = os.stat(config_file)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
     @staticmethod
     def __get_config_file():
-        baseDir = constants.ConductoPaths.get_local_base_dir()
-        defaultConfigFile = os.path.join(baseDir, "config")
-        configFile = os.environ.get("CONDUCTO_CONFIG", defaultConfigFile)
-        return os.path.expanduser(configFile)
+        # expanduser() reads HOME, or USERPROFILE on Windows.
+        names = ["CONDUCTO_CONFIG", "CONDUCTO_BASE_DIR", "HOME", "USERPROFILE"]
+        key = tuple(os.environ.get(name) for name in names)
+        configFile = Config._config_files.get(key)
+        if configFile is None:
+            if key[0] is None:
+                baseDir = constants.ConductoPaths.get_local_base_dir()
+                configFile = os.path.join(baseDir, "config")
+            else:
+                configFile = key[0]
+            configFile = Config._config_files[key] = os.path.expanduser(configFile)
+        return configFile
+
+
+_MISSING = object()
+
+
+def _snapshot(parser):
+    return {
+        section: dict(parser.items(section, raw=True)) for section in parser.sections()
+    }
+
+
+def _apply_changes(parser, old, new):
+    """
+    Make the changes from snapshot `old` to snapshot `new` to `parser`, leaving
+    everything else in it as it is.
+    """
+    for section, values in new.items():
+        before = old.get(section)
+        if before is None:
+            before = {}
+            if not parser.has_section(section):
+                parser.add_section(section)
+        for key, value in values.items():
+            if before.get(key) != value:
+                if not parser.has_section(section):
+                    parser.add_section(section)
+                parser.set(section, key, value)
+        for key in before.keys() - values.keys():
+            if parser.has_section(section):
+                parser.remove_option(section, key)
+    for section in old.keys() - new.keys():
+        if parser.has_section(section):
+            for key in old[section]:
+                parser.remove_option(section, key)
+            if not parser.options(section):
+                parser.remove_section(section)
+
+
+@contextlib.contextmanager
+def _lock_file(path):
+    try:
+        import fcntl
+    except ImportError:
+        # No advisory locks on Windows. The rename is still atomic.
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -1,4 +1,5 @@
-import boto3
+import typing
+
 from .. import api
 from ..shared import constants, types as t, request_utils
 from . import api_utils
@@ -81,7 +82,10 @@ class Pipeline:
         api_utils.get_data(response)
 
     def save_serialization(
-        self, token: t.Token, pipeline_id: t.PipelineId, serialization: str
+        self,
+        token: t.Token,
+        pipeline_id: t.PipelineId,
+        serialization: typing.Union[str, typing.BinaryIO],
     ):
         pipeline = self.get(token, pipeline_id)
         put_serialization_s3(token, pipeline["program_path"], serialization)
@@ -119,6 +123,8 @@ def _get_s3_split(path):
 
 
 def put_serialization_s3(token, s3path, serialization):
+    import boto3
+
     bucket, key = _get_s3_split(s3path)
     # log.log("S3 bucket={}, key={}".format(bucket, key))
 
@@ -132,7 +138,11 @@ def put_serialization_s3(token, s3path, serialization):
         aws_session_token=creds["SessionToken"],
     )
     s3 = session.client("s3")
-    s3.put_object(Body=serialization.encode("utf-8"), Bucket=bucket, Key=key)
+    if isinstance(serialization, str):
+        s3.put_object(Body=serialization.encode("utf-8"), Bucket=bucket, Key=key)
+    else:
+        # Uploads a file object in parts, without reading it into memory.
+        s3.upload_fileobj(serialization, bucket, key)
 
 
 AsyncPipeline = api_utils.async_helper(Pipeline)
@@ -1,3 +1,10 @@
+import collections
+import concurrent.futures
+import contextlib
+import datetime
+import functools
+import hashlib
+import importlib.util
 import os
 import inspect
 import io
@@ -5,12 +12,18 @@ import json
 import re
 import sys
 import tarfile
+import threading
 import time
 import typing
 import urllib.parse
 
 from . import api
-from .shared import constants, types as t
+from .shared import constants, file_utils, log, types as t
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 class _Context:
@@ -19,23 +32,9 @@ class _Context:
         self.local = local
 
         if not self.local:
-            import boto3
-            from conducto.api import Auth
-
             self.is_s3 = True
 
-            auth = Auth()
-            token = os.environ["CONDUCTO_DATA_TOKEN"]
-            token = auth.get_refreshed_token(token)
-            creds = auth.get_credentials(token)
-
-            session = boto3.Session(
-                aws_access_key_id=creds["AccessKeyId"],
-                aws_secret_access_key=creds["SecretKey"],
-                aws_session_token=creds["SessionToken"],
-            )
-            self.s3 = session.resource("s3")
-            self.s3_client = session.client("s3")
+            self.s3_client = _S3Session.get(os.environ["CONDUCTO_DATA_TOKEN"]).client
             m = re.search("^s3://(.*?)/(.*)", self.uri)
             self.bucket, self.key_root = m.group(1, 2)
         else:
@@ -44,19 +43,553 @@ class _Context:
     def get_s3_key(self, name):
         return _safe_join(self.key_root, name)
 
-    def get_s3_obj(self, name):
-        return self.s3.Object(self.bucket, self.get_s3_key(name))
-
     def get_path(self, name):
         return _safe_join(self.uri, name)
 
 
+class _S3Session:
+    """
+    Process-wide S3 client shared by every _Context, so that repeated calls reuse
+    its connection pool instead of fetching new credentials and creating a new
+    boto3 session each time. Credentials are fetched once and refreshed by botocore
+    shortly before they expire. Safe to use from multiple threads.
+
+    There is one per token. Calls may pass the token from CONDUCTO_DATA_TOKEN or
+    the one set on _Data, and those can differ, so the last few are kept rather
+    than each call replacing the other's session.
+    """
+
+    # botocore starts refreshing credentials 15 minutes before they expire, so
+    # consider cached ones stale at that point too.
+    REFRESH_WINDOW_SECS = 15 * 60
+    MAX_SESSIONS = 4
+
+    _instances = collections.OrderedDict()
+    _instance_lock = threading.Lock()
+
+    def __init__(self, token):
+        self.token = token
+        self._lock = threading.RLock()
+        self._creds = None
+        self._expiry = 0
+        self._client = None
+
+    @classmethod
+    def get(cls, token) -> "_S3Session":
+        with cls._instance_lock:
+            try:
+                cls._instances.move_to_end(token)
+            except KeyError:
+                cls._instances[token] = cls(token)
+                while len(cls._instances) > cls.MAX_SESSIONS:
+                    cls._instances.popitem(last=False)
+            return cls._instances[token]
+
+    def credentials(self) -> dict:
+        with self._lock:
+            if time.time() + self.REFRESH_WINDOW_SECS >= self._expiry:
+                self._creds = _get_credentials(self.token)
+                self._expiry = api.auth._parse_expiration(self._creds.get("Expiration"))
+            return self._creds
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = self._make_client()
+            return self._client
+
+    def _make_client(self):
+        import boto3
+        import botocore.config
+        import botocore.credentials
+        import botocore.session
+
+        def metadata():
+            creds = self.credentials()
+            expiry = datetime.datetime.fromtimestamp(
+                self._expiry, tz=datetime.timezone.utc
+            )
+            return {
+                "access_key": creds["AccessKeyId"],
+                "secret_key": creds["SecretKey"],
+                "token": creds["SessionToken"],
+                "expiry_time": expiry.isoformat(),
+            }
+
+        credentials = botocore.credentials.RefreshableCredentials.create_from_metadata(
+            metadata=metadata(), refresh_using=metadata, method="conducto"
+        )
+        botocore_session = botocore.session.get_session()
+        botocore_session._credentials = credentials
+        session = boto3.Session(botocore_session=botocore_session)
+        max_pool_connections = int(
+            api.Config().get("config", "data_max_pool_connections", 50)
+        )
+        return session.client(
+            "s3",
+            config=botocore.config.Config(max_pool_connections=max_pool_connections),
+        )
+
+
+def _get_transfer_settings():
+    """
+    Part size and number of parallel requests for multipart uploads and ranged
+    downloads, from the `data_part_size` and `data_max_concurrency` options in the
+    `[config]` section. Memory used by a transfer is bounded by their product.
+    """
+    config = api.Config()
+    part_size = int(config.get("config", "data_part_size", 8 * 2 ** 20))
+    concurrency = int(config.get("config", "data_max_concurrency", 10))
+    return part_size, concurrency
+
+
+def _get_transfer_config():
+    import boto3.s3.transfer
+
+    part_size, concurrency = _get_transfer_settings()
+    return boto3.s3.transfer.TransferConfig(
+        multipart_threshold=part_size,
+        multipart_chunksize=part_size,
+        max_concurrency=concurrency,
+    )
+
+
+# From <linux/fs.h>: clone a whole file, sharing its extents copy-on-write.
+_FICLONE = 0x40049409
+
+
+def _local_copy(src, dst, link=False):
+    """
+    Atomically put a copy of `src` at `dst` without moving its bytes through this
+    process when possible. In order, try a hardlink (only if `link`), a reflink,
+    then copy_file_range or sendfile, and last a regular copy.
+
+    With a hardlink, both names are the same file, so modifying one in place
+    modifies the other. Replacing either one is always safe.
+    """
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return
+    dirpath = os.path.dirname(os.path.abspath(dst))
+    os.makedirs(dirpath, exist_ok=True)
+
+    if link:
+        tmppath = os.path.join(dirpath, f".tmp{os.urandom(8).hex()}")
+        try:
+            os.link(src, tmppath)
+        except OSError:
+            # Different filesystem, or links aren't supported.
+            pass
+        else:
+            _replace(tmppath, dst)
+            return
+
+    perms = os.stat(src).st_mode & 0o7777
+    with open(src, "rb") as fsrc, file_utils.atomic_write(dst, perms=perms) as fdst:
+        _copy_fd(fsrc.fileno(), fdst.fileno())
+
+
+def _replace(tmppath, dst):
+    os.replace(tmppath, dst)
+    # Renaming a link onto another link to the same file is a no-op that leaves
+    # `tmppath` behind.
+    if os.path.lexists(tmppath):
+        os.remove(tmppath)
+
+
+def _copy_fd(infd, outfd):
+    # Each method continues from the current offsets of both files, so a later one
+    # can take over if an earlier one isn't supported here.
+    if fcntl is not None and sys.platform.startswith("linux"):
+        try:
+            fcntl.ioctl(outfd, _FICLONE, infd)
+            return
+        except OSError:
+            pass
+
+    remaining = os.fstat(infd).st_size
+    for name in ["copy_file_range", "sendfile"]:
+        if not hasattr(os, name):
+            continue
+        copied = 0
+        try:
+            while remaining > 0:
+                count = min(remaining, 2 ** 30)
+                if name == "copy_file_range":
+                    n = os.copy_file_range(infd, outfd, count)
+                else:
+                    n = os.sendfile(outfd, infd, None, count)
+                if n == 0:
+                    break
+                copied += n
+                remaining -= n
+            if copied and remaining == 0:
+                return
+            # It stopped early, either because the file shrank or because this
+            # method can't read it, as with files in /proc that claim to be empty.
+            # Let the next one continue, and the last one copies until the actual
+            # end of the file.
+        except OSError:
+            # Only fall back if this method couldn't start, e.g. across
+            # filesystems or on a platform where it can't write to files.
+            if copied:
+                raise
+
+    while True:
+        buf = os.read(infd, 2 ** 20)
+        if not buf:
+            break
+        view = memoryview(buf)
+        while view:
+            view = view[os.write(outfd, view) :]
+
+
+class _ParallelReader(io.RawIOBase):
+    """
+    Readable stream of the concatenation of `fetch(item)` for each item, fetching
+    up to `concurrency` items at once in background threads. `on_close` is called
+    when the stream is closed.
+    """
+
+    _DONE = object()
+
+    def __init__(self, fetch, items, concurrency, on_close=None):
+        super().__init__()
+        self.fetch = fetch
+        self.on_close = on_close
+        self._items = iter(items)
+        self._concurrency = concurrency
+        self._executor = concurrent.futures.ThreadPoolExecutor(concurrency)
+        self._pending = collections.deque()
+        self._buf = memoryview(b"")
+        self._schedule()
+
+    def _schedule(self):
+        while len(self._pending) < self._concurrency:
+            item = next(self._items, self._DONE)
+            if item is self._DONE:
+                break
+            self._pending.append(self._executor.submit(self.fetch, item))
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buf:
+            if not self._pending:
+                return 0
+            self._buf = memoryview(self._pending.popleft().result())
+            self._schedule()
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def close(self):
+        if not self.closed:
+            for fut in self._pending:
+                fut.cancel()
+            self._pending.clear()
+            self._executor.shutdown(wait=False)
+            if self.on_close is not None:
+                self.on_close()
+        super().close()
+
+
+class _RangedReader(_ParallelReader):
+    """
+    Read-only stream over an S3 object that downloads it as parallel ranged GETs.
+    At most `concurrency` parts of `part_size` bytes are held in memory at once, no
+    matter how big the object is.
+    """
+
+    def __init__(self, client, bucket, key, part_size, concurrency, head=None):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+
+        if head is None:
+            head = client.head_object(Bucket=bucket, Key=key)
+        self.size = head["ContentLength"]
+        self.etag = head["ETag"]
+
+        ranges = (
+            (begin, min(begin + part_size, self.size) - 1)
+            for begin in range(0, self.size, part_size)
+        )
+        super().__init__(self._fetch, ranges, concurrency)
+
+    def _fetch(self, byte_range):
+        # The end of `byte_range` is inclusive, per the HTTP Range header. IfMatch
+        # makes sure every part comes from the same version of the object.
+        begin, end = byte_range
+        result = self.client.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f"bytes={begin}-{end}",
+            IfMatch=self.etag,
+        )
+        return result["Body"].read()
+
+
+class _SeekableReader(io.RawIOBase):
+    # Position bookkeeping for the random-access readers below. Subclasses set
+    # `size` and implement `_read_at()`.
+    size = 0
+
+    def __init__(self):
+        super().__init__()
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if pos < 0:
+            raise ValueError(f"Negative seek position: {pos}")
+        self._pos = pos
+        return pos
+
+    def readinto(self, b):
+        if self.closed:
+            raise ValueError("I/O operation on closed file.")
+        n = max(0, min(len(b), self.size - self._pos))
+        if n:
+            self._read_at(self._pos, memoryview(b)[:n])
+            self._pos += n
+        return n
+
+
+class _MmapReader(_SeekableReader):
+    """Memory-mapped local file. Only the pages that are read are loaded."""
+
+    def __init__(self, path):
+        import mmap
+
+        super().__init__()
+        self.name = path
+        with open(path, "rb") as f:
+            self.size = os.fstat(f.fileno()).st_size
+            # Empty files can't be mapped.
+            self._mm = (
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else b""
+            )
+
+    def _read_at(self, pos, view):
+        view[:] = self._mm[pos : pos + len(view)]
+
+    def close(self):
+        if not self.closed and self.size:
+            self._mm.close()
+        super().close()
+
+
+class _BlockReader(_SeekableReader):
+    """
+    Random-access reader over an S3 object. It is fetched in blocks of `block_size`
+    with ranged GETs, and recently used blocks are kept in memory. When reads are
+    sequential, the next `read_ahead` blocks are fetched in the background.
+    """
+
+    def __init__(self, client, bucket, key, block_size, read_ahead, head=None):
+        super().__init__()
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.name = key
+        self.block_size = block_size
+        self.read_ahead = read_ahead
+        self.max_blocks = max(16, 2 * read_ahead)
+
+        if head is None:
+            head = client.head_object(Bucket=bucket, Key=key)
+        self.size = head["ContentLength"]
+        self.etag = head["ETag"]
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max(read_ahead, 1))
+        # Block index -> Future of its bytes, least recently used first.
+        self._blocks = collections.OrderedDict()
+        self._last_block = None
+
+    def _fetch(self, idx):
+        # The Range header includes its end. IfMatch makes sure every block comes
+        # from the same version of the object.
+        begin = idx * self.block_size
+        end = min(begin + self.block_size, self.size) - 1
+        result = self.client.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f"bytes={begin}-{end}",
+            IfMatch=self.etag,
+        )
+        return result["Body"].read()
+
+    def _block(self, idx):
+        fut = self._blocks.get(idx)
+        if fut is None:
+            fut = self._executor.submit(self._fetch, idx)
+            self._blocks[idx] = fut
+            # Evicted blocks aren't cancelled, since the current read may need them.
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+        else:
+            self._blocks.move_to_end(idx)
+        return fut
+
+    def _read_at(self, pos, view):
+        first = pos // self.block_size
+        last = (pos + len(view) - 1) // self.block_size
+        # Start every block this read needs at once, so they download in parallel.
+        futs = [self._block(idx) for idx in range(first, last + 1)]
+        if self._last_block is not None and first in (
+            self._last_block,
+            self._last_block + 1,
+        ):
+            num_blocks = -(-self.size // self.block_size)
+            for idx in range(last + 1, min(last + 1 + self.read_ahead, num_blocks)):
+                self._block(idx)
+        self._last_block = last
+
+        offset = pos - first * self.block_size
+        written = 0
+        for fut in futs:
+            data = fut.result()[offset:]
+            n = min(len(data), len(view) - written)
+            view[written : written + n] = data[:n]
+            written += n
+            offset = 0
+
+    def close(self):
+        if not self.closed:
+            for fut in self._blocks.values():
+                fut.cancel()
+            self._blocks.clear()
+            self._executor.shutdown(wait=False)
+        super().close()
+
+
+class _AsyncData:
+    """
+    Awaitable versions of the data methods, for asyncio code. Calls run in a thread
+    pool shared by every `aio` object, and so share one S3 client and its
+    connections. At most `data_aio_concurrency` calls run at once; the rest wait
+    their turn. Errors that may be transient are retried up to `data_aio_retries`
+    times, with exponential backoff.
+    """
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    def __init__(self, data_cls):
+        self._data_cls = data_cls
+
+    def __get__(self, instance, owner):
+        # Used as a class attribute, so that `co.temp_data.aio` is bound to the class.
+        return _AsyncData(owner)
+
+    async def get(self, name, file):
+        """Get object at `name`, store it to `file`."""
+        return await self._call(self._data_cls.get, name, file)
+
+    async def gets(self, name, *, byte_range: typing.List[int] = None) -> bytes:
+        """
+        Return object at `name`. Optionally restrict to the given `byte_range`.
+        """
+        return await self._call(self._data_cls.gets, name, byte_range=byte_range)
+
+    async def put(self, name, file):
+        """Store object in `file` to `name`."""
+        return await self._call(self._data_cls.put, name, file)
+
+    async def puts(self, name, obj: bytes):
+        """Store `obj` to `name`."""
+        return await self._call(self._data_cls.puts, name, obj)
+
+    async def exists(self, name) -> bool:
+        """Test if there is an object at `name`."""
+        return await self._call(self._data_cls.exists, name)
+
+    async def list(self, prefix) -> typing.List[str]:
+        """Return names of objects that start with `prefix`."""
+        return await self._call(self._data_cls.list, prefix)
+
+    async def _call(self, fxn, *args, **kwargs):
+        import asyncio
+        import random
+
+        config = api.Config()
+        retries = int(config.get("config", "data_aio_retries", 3))
+        backoff = float(config.get("config", "data_aio_backoff", 0.5))
+
+        loop = asyncio.get_running_loop()
+        call = functools.partial(fxn, *args, **kwargs)
+        for attempt in range(retries + 1):
+            try:
+                return await loop.run_in_executor(self._get_executor(), call)
+            except Exception as e:
+                if attempt == retries or not _is_transient_error(e):
+                    raise
+            # Jitter keeps many failed calls from retrying in lockstep.
+            await asyncio.sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    @classmethod
+    def _get_executor(cls):
+        with cls._executor_lock:
+            if cls._executor is None:
+                concurrency = int(
+                    api.Config().get("config", "data_aio_concurrency", 32)
+                )
+                cls._executor = concurrent.futures.ThreadPoolExecutor(concurrency)
+            return cls._executor
+
+
+def _is_transient_error(e):
+    try:
+        import botocore.exceptions
+    except ImportError:
+        return False
+    transient = (
+        botocore.exceptions.ConnectionError,
+        botocore.exceptions.HTTPClientError,
+    )
+    if isinstance(e, transient):
+        return True
+    if isinstance(e, botocore.exceptions.ClientError):
+        code = e.response.get("Error", {}).get("Code")
+        status = e.response.get("ResponseMetadata", {}).get("HTTPStatusCode", 0)
+        return (
+            code in ("SlowDown", "RequestTimeout", "Throttling", "InternalError")
+            or status >= 500
+        )
+    return False
+
+
 class _Data:
     _pipeline_id: t.PipelineId = None
     _local: bool = None
     _token: t.Token = None
     _s3_bucket: str = None
 
+    # Awaitable versions of get/gets/put/puts/exists/list. See _AsyncData.
+    aio = _AsyncData(None)
+
     @staticmethod
     def _get_uri():
         raise NotImplementedError()
@@ -106,57 +639,78 @@ class _Data:
         """
         ctx = cls._ctx()
         if not ctx.local:
-            return ctx.get_s3_obj(name).download_file(file)
+            read_cache = _ReadCache.from_config()
+            if read_cache is not None:
+                hit, _ = read_cache.read(
+                    ctx.s3_client,
+                    ctx.bucket,
+                    ctx.get_s3_key(name),
+                    lambda path: _local_copy(path, file),
+                )
+                if hit:
+                    return
+            return ctx.s3_client.download_file(
+                ctx.bucket, ctx.get_s3_key(name), file, Config=_get_transfer_config()
+            )
         else:
-            import shutil
-
-            shutil.copy(ctx.get_path(name), file)
+            # Never link, so that modifying `file` can't modify the stored object.
+            _local_copy(ctx.get_path(name), file)
 
     @classmethod
     def gets(cls, name, *, byte_range: typing.List[int] = None) -> bytes:
         """
         Return object at `name`. Optionally restrict to the given `byte_range`.
         """
+        return cls._gets(name, byte_range=byte_range, use_read_cache=True)
+
+    @classmethod
+    def _gets(cls, name, *, byte_range=None, use_read_cache=False) -> bytes:
         ctx = cls._ctx()
         if not ctx.local:
+            read_cache = _ReadCache.from_config() if use_read_cache else None
+            if read_cache is not None:
+                # Ranges are only served from the cache if the whole object is there.
+                hit, data = read_cache.read(
+                    ctx.s3_client,
+                    ctx.bucket,
+                    ctx.get_s3_key(name),
+                    lambda path: _read_file(path, byte_range),
+                    download=not byte_range,
+                )
+                if hit:
+                    return data
+
             kwargs = {}
             if byte_range:
+                # `byte_range` excludes `end`, but the HTTP Range header includes it.
                 begin, end = byte_range
-                kwargs["Range"] = f"bytes {begin}-{end}"
-            return ctx.get_s3_obj(name).get(**kwargs)["Body"].read()
+                if end <= begin:
+                    return b""
+                kwargs["Range"] = f"bytes={begin}-{end - 1}"
+            return ctx.s3_client.get_object(
+                Bucket=ctx.bucket, Key=ctx.get_s3_key(name), **kwargs
+            )["Body"].read()
         else:
-            with open(ctx.get_path(name), "rb") as f:
-                if byte_range:
-                    begin, end = byte_range
-                    f.seek(begin)
-                    return f.read(end - begin)
-                else:
-                    return f.read()
+            return _read_file(ctx.get_path(name), byte_range)
 
     @classmethod
     def put(cls, name, file):
         """
         Store object in `file` to `name`.
+
+        Locally, if the `data_local_hardlinks` option in the `[config]` section is
+        true, the object is stored as a hardlink to `file` when possible. Then
+        `file` must not be modified in place afterwards, since that would modify
+        the stored object too; replacing or deleting it is fine.
         """
         ctx = cls._ctx()
         if not ctx.local:
-            ctx.get_s3_obj(name).upload_file(file)
+            ctx.s3_client.upload_file(
+                file, ctx.bucket, ctx.get_s3_key(name), Config=_get_transfer_config()
+            )
         else:
-            # Make sure to write the obj atomically. Write to a temp file then move it
-            # into the final location. If anything goes wrong delete the temp file.
-            import tempfile, shutil
-
-            path = ctx.get_path(name)
-            dirpath = os.path.dirname(path)
-            os.makedirs(os.path.dirname(path), exist_ok=True)
-            fd, tmppath = tempfile.mkstemp(dir=dirpath)
-            try:
-                shutil.copy(file, tmppath)
-            except Exception:
-                os.remove(tmppath)
-                raise
-            else:
-                shutil.move(tmppath, path)
+            link = t.Bool(api.Config().get("config", "data_local_hardlinks", False))
+            _local_copy(file, ctx.get_path(name), link=link)
 
     @classmethod
     def puts(cls, name, obj: bytes):
@@ -164,24 +718,72 @@ class _Data:
             raise ValueError(f"Expected 'obj' of type 'bytes', but got {type(bytes)}")
         ctx = cls._ctx()
         if not ctx.local:
-            ctx.get_s3_obj(name).put(Body=obj)
+            ctx.s3_client.put_object(
+                Bucket=ctx.bucket, Key=ctx.get_s3_key(name), Body=obj
+            )
         else:
-            # Make sure to write the obj atomically. Write to a temp file then move it
-            # into the final location. If anything goes wrong delete the temp file.
-            import tempfile, shutil
+            with file_utils.atomic_write(ctx.get_path(name)) as f:
+                f.write(obj)
 
-            path = ctx.get_path(name)
-            dirpath = os.path.dirname(path)
-            os.makedirs(dirpath, exist_ok=True)
-            fd, tmppath = tempfile.mkstemp(dir=dirpath)
-            try:
-                with open(fd, "wb") as f:
-                    f.write(obj)
-            except Exception:
-                os.remove(tmppath)
-                raise
-            else:
-                shutil.move(tmppath, path)
+    @classmethod
+    def get_stream(cls, name) -> typing.BinaryIO:
+        """
+        Return a read-only binary stream of the object at `name`. From S3 it is
+        downloaded in parallel ranged requests, using memory independent of its size.
+        """
+        ctx = cls._ctx()
+        if not ctx.local:
+            part_size, concurrency = _get_transfer_settings()
+            raw = _RangedReader(
+                ctx.s3_client, ctx.bucket, ctx.get_s3_key(name), part_size, concurrency,
+            )
+            return io.BufferedReader(raw, buffer_size=part_size)
+        else:
+            return open(ctx.get_path(name), "rb")
+
+    @classmethod
+    def open(cls, name) -> typing.BinaryIO:
+        """
+        Return a seekable, read-only file object for the object at `name`, so
+        libraries that seek can read parts of a large object without downloading it
+        all. Locally the file is memory-mapped. From S3 it is read in blocks of
+        `data_read_block_size` bytes with ranged requests, and up to
+        `data_read_ahead` following blocks are prefetched while reading sequentially.
+        """
+        ctx = cls._ctx()
+        if not ctx.local:
+            key = ctx.get_s3_key(name)
+            read_cache = _ReadCache.from_config()
+            if read_cache is not None:
+                hit, reader = read_cache.read(
+                    ctx.s3_client, ctx.bucket, key, _MmapReader, download=False
+                )
+                if hit:
+                    return reader
+            config = api.Config()
+            block_size = int(config.get("config", "data_read_block_size", 2 ** 20))
+            read_ahead = int(config.get("config", "data_read_ahead", 4))
+            return _BlockReader(ctx.s3_client, ctx.bucket, key, block_size, read_ahead)
+        else:
+            return _MmapReader(ctx.get_path(name))
+
+    @classmethod
+    def put_stream(cls, name, fileobj: typing.BinaryIO):
+        """
+        Read `fileobj` until EOF and store it to `name`. `fileobj` does not need to be
+        seekable. To S3 it is sent as a parallel multipart upload, using memory
+        independent of its size.
+        """
+        ctx = cls._ctx()
+        if not ctx.local:
+            ctx.s3_client.upload_fileobj(
+                fileobj, ctx.bucket, ctx.get_s3_key(name), Config=_get_transfer_config()
+            )
+        else:
+            import shutil
+
+            with file_utils.atomic_write(ctx.get_path(name)) as f:
+                shutil.copyfileobj(fileobj, f)
 
     @classmethod
     def delete(cls, name, recursive=False):
@@ -191,9 +793,18 @@ class _Data:
         ctx = cls._ctx()
         if not ctx.local:
             if recursive:
-                # TODO: S3 delete recursive
-                raise NotImplementedError("Haven't done this yet.")
-            return ctx.get_s3_obj(name).delete()
+                # Delete the object itself and everything "inside" it.
+                key = ctx.get_s3_key(name)
+                paginator = ctx.s3_client.get_paginator("list_objects_v2")
+                keys = [key]
+                for page in paginator.paginate(
+                    Bucket=ctx.bucket, Prefix=key.rstrip("/") + "/"
+                ):
+                    keys += [obj["Key"] for obj in page.get("Contents", [])]
+                return _delete_s3_keys(ctx, keys)
+            return ctx.s3_client.delete_object(
+                Bucket=ctx.bucket, Key=ctx.get_s3_key(name)
+            )
         else:
             import shutil
 
@@ -208,15 +819,11 @@ class _Data:
         """
         Return names of objects that start with `prefix`.
         """
-        # TODO: make this more like listdir or more like glob. Right now pattern matching is inconsistent between local and cloud.
+        # This is kept for compatibility: in S3 it lists recursively, but locally it
+        # lists the directory `prefix`. Use iter_list() for consistent semantics.
         ctx = cls._ctx()
         if not ctx.local:
-            bkt = ctx.s3.Bucket(ctx.bucket)
-            prefix_size = len(ctx.get_s3_key(""))
-            return [
-                obj.key[prefix_size:]
-                for obj in bkt.objects.filter(Prefix=ctx.get_s3_key(prefix))
-            ]
+            return [entry.name for entry in cls.iter_list(prefix)]
         else:
             path = ctx.get_path(prefix)
             try:
@@ -225,6 +832,42 @@ class _Data:
                 return []
             return [_safe_join(prefix, name) for name in sorted(names)]
 
+    @classmethod
+    def iter_list(
+        cls, prefix="", delimiter=None, recursive=True, page_size=1000
+    ) -> typing.Iterator["ListEntry"]:
+        """
+        Lazily yield a :py:class:`ListEntry` with the name, size and mtime of each
+        object whose name starts with `prefix`, in lexicographic order. The
+        semantics are the same for S3 and local data.
+
+        If `recursive` is False, `delimiter` defaults to "/". With a `delimiter`,
+        names that contain it after `prefix` are grouped into a single entry for
+        their common prefix, ending in `delimiter`, with `size` and `mtime` of None.
+        This is like listing a directory. `page_size` is how many keys to request
+        from S3 at a time.
+        """
+        if not recursive and delimiter is None:
+            delimiter = "/"
+        ctx = cls._ctx()
+        if not ctx.local:
+            yield from _iter_list_s3(ctx, prefix, delimiter, page_size)
+        elif delimiter is None or delimiter == "/":
+            yield from _iter_list_local(ctx, prefix, delimiter)
+        else:
+            # Group the recursive listing. Names with the same common prefix are
+            # adjacent, because the listing is sorted.
+            last_common = None
+            for entry in _iter_list_local(ctx, prefix, None):
+                idx = entry.name.find(delimiter, len(prefix))
+                if idx < 0:
+                    yield entry
+                else:
+                    common = entry.name[: idx + len(delimiter)]
+                    if common != last_common:
+                        yield ListEntry(common, None, None)
+                        last_common = common
+
     @classmethod
     def exists(cls, name):
         """
@@ -257,49 +900,305 @@ class _Data:
         else:
             return os.stat(ctx.get_path(name)).st_size
 
+    @classmethod
+    def exists_many(cls, names: typing.Iterable[str]) -> typing.List[bool]:
+        """
+        Test if there is an object at each of `names`, checking them concurrently.
+        """
+        return _map_concurrently(cls.exists, names)
+
+    @classmethod
+    def size_many(cls, names: typing.Iterable[str]) -> typing.List[int]:
+        """
+        Return the size of each object in `names`, in bytes, looking them up
+        concurrently.
+        """
+        return _map_concurrently(cls.size, names)
+
+    @classmethod
+    def get_many(cls, pairs: typing.Iterable[typing.Tuple[str, str]]):
+        """
+        For each `(name, file)` in `pairs`, get object at `name` and store it to
+        `file`, concurrently.
+        """
+        _map_concurrently(lambda pair: cls.get(*pair), pairs)
+
+    @classmethod
+    def put_many(cls, pairs: typing.Iterable[typing.Tuple[str, str]]):
+        """
+        For each `(name, file)` in `pairs`, store object in `file` to `name`,
+        concurrently.
+        """
+        _map_concurrently(lambda pair: cls.put(*pair), pairs)
+
+    @classmethod
+    def delete_many(cls, names: typing.Iterable[str]):
+        """
+        Delete the objects at `names`. Names that don't exist are ignored. In S3
+        this sends up to 1000 names per request.
+        """
+        ctx = cls._ctx()
+        if not ctx.local:
+            _delete_s3_keys(ctx, [ctx.get_s3_key(name) for name in names])
+        else:
+            for name in names:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(ctx.get_path(name))
+
     @classmethod
     def clear_cache(cls, name, checksum=None):
         """
         Clear cache at `name` with `checksum`, clears all `name` cache if no `checksum`.
+        Chunks that no remaining cache refers to are garbage collected at most once
+        every `cache_gc_interval` seconds, an option in the `[config]` section that
+        defaults to a day. Call gc_cache to collect them right away.
         """
+        _check_cache_name(name)
         data_path = f"conducto-cache/{name}"
         if checksum is None:
-            for file in cls.list(data_path):
-                cls.delete(file)
+            # List with the trailing "/", so that other caches whose names start
+            # with `name` are left alone.
+            cls.delete_many(entry.name for entry in cls.iter_list(data_path + "/"))
         else:
-            cls.delete(f"{data_path}/{checksum}.tar.gz")
+            cls.delete_many(
+                [
+                    f"{data_path}/{checksum}.manifest.json",
+                    f"{data_path}/{checksum}.tar.gz",
+                ]
+            )
+        cls._maybe_gc_cache()
+
+    @classmethod
+    def _maybe_gc_cache(cls):
+        # gc_cache reads every manifest, so only run it if it hasn't run recently.
+        interval = float(
+            api.Config().get("config", "cache_gc_interval", _CACHE_GC_INTERVAL)
+        )
+        if cls.exists(_CACHE_GC_TIME_PATH):
+            with contextlib.suppress(ValueError):
+                last = float(cls.gets(_CACHE_GC_TIME_PATH))
+                if time.time() - last < interval:
+                    return
+        cls.puts(_CACHE_GC_TIME_PATH, str(time.time()).encode())
+        cls.gc_cache()
 
     @classmethod
     def cache_exists(cls, name, checksum):
         """
         Test if there is a cache at `name` with `checksum`.
         """
-        data_path = f"conducto-cache/{name}/{checksum}.tar.gz"
-        return cls.exists(data_path)
+        _check_cache_name(name)
+        data_path = f"conducto-cache/{name}/{checksum}"
+        return cls.exists(f"{data_path}.manifest.json") or cls.exists(
+            f"{data_path}.tar.gz"
+        )
 
     @classmethod
-    def save_cache(cls, name, checksum, save_dir):
+    def save_cache(cls, name, checksum, save_dir, *, codec=None, level=None):
         """
         Save `save_dir` to cache at `name` with `checksum`.
+
+        The archive is split into content-defined chunks that are stored once in a
+        content-addressed store shared by all caches, so only chunks that aren't
+        already stored are uploaded. Chunks are compressed with `codec`: "gzip",
+        "zstd" (needs the `zstandard` package), "none", or "auto" for zstd if it is
+        installed and gzip otherwise. `codec` and `level` default to the
+        `cache_codec` and `cache_compress_level` options in the `[config]` section.
+        """
+        _check_cache_name(name)
+        manifest_path = f"conducto-cache/{name}/{checksum}.manifest.json"
+        codec, level = _get_cache_codec(codec, level)
+        for _attempt in range(3):
+            chunks, reused = cls._store_chunks(save_dir, codec, level)
+
+            # Write the manifest last, so that its presence means every chunk is
+            # stored.
+            manifest = {
+                "version": _CACHE_MANIFEST_VERSION,
+                "codec": codec,
+                "level": level,
+                "chunks": chunks,
+            }
+            cls.puts(manifest_path, json.dumps(manifest).encode())
+
+            # Reused chunks were touched so that gc_cache keeps them, but one that
+            # listed them before that may still have deleted them. Now that the
+            # manifest refers to them they are safe, so make sure they're there.
+            if all(cls.exists_many(reused)):
+                return
+        raise RuntimeError(
+            f"Chunks of cache {name} were deleted while it was being saved"
+        )
+
+    @classmethod
+    def _store_chunks(cls, save_dir, codec, level):
+        # Split `save_dir` into chunks and store those that aren't stored yet.
+        # Return the manifest's list of chunks, and the paths of the chunks that
+        # were already stored.
+        compress = _get_compress_fxn(codec, level)
+        _part_size, concurrency = _get_transfer_settings()
+        workers = max(concurrency, os.cpu_count() or 1)
+        executor = concurrent.futures.ThreadPoolExecutor(workers)
+        pending = collections.deque()
+        chunks = []
+        seen = set()
+        reused = []
+
+        def _store(digest, data):
+            chunk_path = _get_chunk_path(digest, codec)
+            try:
+                # Bump the mtime of a chunk that is already stored, so that gc_cache
+                # doesn't take it for an old, unreferenced one.
+                cls._touch(chunk_path)
+            except FileNotFoundError:
+                cls.puts(chunk_path, compress(data))
+            else:
+                reused.append(chunk_path)
+
+        def _on_chunk(data):
+            digest = hashlib.blake2b(data, digest_size=20).hexdigest()
+            chunks.append([digest, len(data)])
+            if digest in seen:
+                return
+            seen.add(digest)
+            # Bound the number of chunks in memory by waiting for the oldest one.
+            while len(pending) >= workers:
+                pending.popleft().result()
+            pending.append(executor.submit(_store, digest, data))
+
+        try:
+            with _ContentDefinedChunker(_on_chunk) as chunker:
+                with tarfile.open(fileobj=chunker, mode="w|") as cmdtar:
+                    arcname = os.path.basename(os.path.normpath(save_dir))
+                    # Members are added in sorted order, so that unchanged files
+                    # produce the same bytes, and so the same chunks.
+                    cmdtar.add(save_dir, arcname=arcname)
+            while pending:
+                pending.popleft().result()
+        finally:
+            executor.shutdown(wait=False)
+        return chunks, reused
+
+    @classmethod
+    def _touch(cls, name):
         """
-        data_path = f"conducto-cache/{name}/{checksum}.tar.gz"
-        tario = io.BytesIO()
-        with tarfile.TarFile(fileobj=tario, mode="w") as cmdtar:
-            cmdtar.add(save_dir, arcname=os.path.basename(os.path.normpath(save_dir)))
-        cls.puts(data_path, tario.getvalue())
+        Set the modification time of the object at `name` to now. Raise
+        FileNotFoundError if there is no such object.
+        """
+        ctx = cls._ctx()
+        if not ctx.local:
+            import botocore.exceptions
+
+            key = ctx.get_s3_key(name)
+            try:
+                # Copying an object onto itself, with new metadata, is how S3 updates
+                # its LastModified.
+                ctx.s3_client.copy_object(
+                    Bucket=ctx.bucket,
+                    Key=key,
+                    CopySource={"Bucket": ctx.bucket, "Key": key},
+                    MetadataDirective="REPLACE",
+                )
+            except botocore.exceptions.ClientError as e:
+                if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                    raise FileNotFoundError(name) from e
+                raise
+        else:
+            os.utime(ctx.get_path(name))
 
     @classmethod
     def restore_cache(cls, name, checksum, restore_dir):
         """
         Restore cache at `name` with `checksum` to `restore_dir`.
         """
+        _check_cache_name(name)
         data_path = f"conducto-cache/{name}/{checksum}.tar.gz"
+        manifest_path = f"conducto-cache/{name}/{checksum}.manifest.json"
         if not cls.cache_exists(name, checksum):
             raise FileNotFoundError("Cache not found")
-        byte_array = cls.gets(data_path)
-        file_like = io.BytesIO(byte_array)
-        tar = tarfile.open(fileobj=file_like)
-        tar.extractall(path=restore_dir)
+
+        if cls.exists(manifest_path):
+            manifest = json.loads(cls.gets(manifest_path))
+            if manifest.get("version") != _CACHE_MANIFEST_VERSION:
+                raise ValueError(
+                    f"Cache {name} with checksum {checksum} has manifest version "
+                    f"{manifest.get('version')}, but only version "
+                    f"{_CACHE_MANIFEST_VERSION} can be restored. Save it again."
+                )
+            stream = cls._open_chunks(manifest)
+            with tarfile.open(fileobj=stream, mode="r|") as tar:
+                tar.extractall(path=restore_dir)
+            return
+
+        # Caches saved before manifests existed are plain tarballs.
+        with cls.get_stream(data_path) as file_like:
+            with tarfile.open(fileobj=file_like, mode="r|*") as tar:
+                tar.extractall(path=restore_dir)
+
+    @classmethod
+    def _open_chunks(cls, manifest):
+        # Return a stream of the concatenated chunks in `manifest`. Chunks are read
+        # from the local chunk cache when possible, and otherwise fetched and added
+        # to it.
+        codec = manifest["codec"]
+        decompress = _get_decompress_fxn(codec)
+        local_cache = None if cls._ctx().local else _ChunkCache.from_config()
+
+        def _fetch(chunk):
+            digest, _size = chunk
+            if local_cache:
+                data = local_cache.get(digest, codec)
+                if data is not None:
+                    with contextlib.suppress(Exception):
+                        data = decompress(data)
+                        if hashlib.blake2b(data, digest_size=20).hexdigest() == digest:
+                            return data
+                    # Corrupt; fetch it again.
+            data = cls._gets(_get_chunk_path(digest, codec))
+            if local_cache:
+                local_cache.put(digest, codec, data)
+            return decompress(data)
+
+        _part_size, concurrency = _get_transfer_settings()
+        # Trim the local cache once everything has been read.
+        on_close = local_cache.evict if local_cache else None
+        raw = _ParallelReader(_fetch, manifest["chunks"], concurrency, on_close)
+        return io.BufferedReader(raw, buffer_size=_CACHE_CHUNK_SIZE)
+
+    @classmethod
+    def gc_cache(cls, grace_secs=3600):
+        """
+        Delete cache chunks that no cache refers to. Chunks stored in the last
+        `grace_secs` seconds are kept, since a cache that is still being saved may
+        need them.
+        """
+        referenced = set()
+        chunks = []
+        for path, _size, mtime in cls.iter_list("conducto-cache/"):
+            if path.startswith(_CACHE_CHUNK_DIR + "/"):
+                if path != _CACHE_GC_TIME_PATH:
+                    chunks.append((path, mtime))
+                continue
+            if not path.endswith(".manifest.json"):
+                continue
+            try:
+                manifest = json.loads(cls.gets(path))
+            except (OSError, ValueError):
+                continue
+            version = manifest.get("version")
+            if not isinstance(version, int) or version > _CACHE_MANIFEST_VERSION:
+                # Saved by a newer version of conducto, so which chunks it refers to
+                # is unknown. Don't delete any.
+                log.warn(f"Not collecting cache chunks: {path} has version {version}")
+                return
+            if version == _CACHE_MANIFEST_VERSION:
+                for digest, _size in manifest["chunks"]:
+                    referenced.add(_get_chunk_path(digest, manifest["codec"]))
+
+        cutoff = time.time() - grace_secs
+        cls.delete_many(
+            path for path, mtime in chunks if path not in referenced and mtime < cutoff
+        )
 
     @classmethod
     def url(cls, name, path_only=True):
@@ -328,7 +1227,7 @@ class pipeline(_Data):
                 + "/data/"
             )
         else:
-            credentials = _get_credentials(_Data._token)
+            credentials = _S3Session.get(_Data._token).credentials()
             return f"s3://{_Data._s3_bucket}/{credentials['IdentityId']}/{_Data._pipeline_id}/data/"
 
     #####
@@ -345,12 +1244,19 @@ class pipeline(_Data):
             "get": cls._get_cli,
             "gets": cls._gets_cli,
             "list": cls._list_cli,
+            "iter-list": cls._iter_list_cli,
             "put": cls._put_cli,
             "puts": cls._puts_cli,
             "size": cls._size_cli,
             "url": cls._url_cli,
             "cache-exists": cls._cache_exists_cli,
             "clear-cache": cls._clear_cache_cli,
+            "gc-cache": cls._gc_cache_cli,
+            "exists-many": cls._exists_many_cli,
+            "size-many": cls._size_many_cli,
+            "get-many": cls._get_many_cli,
+            "put-many": cls._put_many_cli,
+            "delete-many": cls._delete_many_cli,
             "save-cache": cls._save_cache_cli,
             "restore-cache": cls._restore_cache_cli,
         }
@@ -396,7 +1302,24 @@ class pipeline(_Data):
         Return names of objects that start with `prefix`.
         """
         cls._init(pipeline_id=id, local=local)
-        return cls.list(prefix)
+        _print_json_array(cls.list(prefix))
+
+    @classmethod
+    def _iter_list_cli(
+        cls,
+        prefix="",
+        delimiter=None,
+        non_recursive: bool = False,
+        *,
+        id=None,
+        local: bool = None,
+    ):
+        """
+        Print the name, size and mtime of each object that starts with `prefix`, one
+        JSON object per line, as they are listed. `--non-recursive` stops at "/".
+        """
+        cls._init(pipeline_id=id, local=local)
+        _print_json_lines(cls.iter_list(prefix, delimiter, not non_recursive))
 
     @classmethod
     def _put_cli(cls, name, file, *, id=None, local: bool = None):
@@ -451,12 +1374,66 @@ class pipeline(_Data):
         return cls.clear_cache(name, checksum)
 
     @classmethod
-    def _save_cache_cli(cls, name, checksum, save_dir, *, id=None, local: bool = None):
+    def _gc_cache_cli(cls, grace_secs: int = 3600, *, id=None, local: bool = None):
         """
-        Save `save_dir` to cache at `name` with `checksum`.
+        Delete cache chunks that no cache refers to and are older than `grace_secs`.
         """
         cls._init(pipeline_id=id, local=local)
-        return cls.save_cache(name, checksum, save_dir)
+        return cls.gc_cache(grace_secs)
+
+    @classmethod
+    def _exists_many_cli(cls, *, id=None, local: bool = None):
+        """
+        Read names from stdin, one per line, and test if there is an object at each.
+        """
+        cls._init(pipeline_id=id, local=local)
+        names = _read_stdin_lines()
+        return dict(zip(names, cls.exists_many(names)))
+
+    @classmethod
+    def _size_many_cli(cls, *, id=None, local: bool = None):
+        """
+        Read names from stdin, one per line, and return the size of each, in bytes.
+        """
+        cls._init(pipeline_id=id, local=local)
+        names = _read_stdin_lines()
+        return dict(zip(names, cls.size_many(names)))
+
+    @classmethod
+    def _get_many_cli(cls, *, id=None, local: bool = None):
+        """
+        Read lines of `name<TAB>file` from stdin. Get each object at `name` and store
+        it to `file`.
+        """
+        cls._init(pipeline_id=id, local=local)
+        return cls.get_many(_read_stdin_pairs())
+
+    @classmethod
+    def _put_many_cli(cls, *, id=None, local: bool = None):
+        """
+        Read lines of `name<TAB>file` from stdin. Store each object in `file` to
+        `name`.
+        """
+        cls._init(pipeline_id=id, local=local)
+        return cls.put_many(_read_stdin_pairs())
+
+    @classmethod
+    def _delete_many_cli(cls, *, id=None, local: bool = None):
+        """
+        Read names from stdin, one per line, and delete the object at each.
+        """
+        cls._init(pipeline_id=id, local=local)
+        return cls.delete_many(_read_stdin_lines())
+
+    @classmethod
+    def _save_cache_cli(
+        cls, name, checksum, save_dir, *, codec=None, id=None, local: bool = None
+    ):
+        """
+        Save `save_dir` to cache at `name` with `checksum`, compressed with `codec`.
+        """
+        cls._init(pipeline_id=id, local=local)
+        return cls.save_cache(name, checksum, save_dir, codec=codec)
 
     @classmethod
     def _restore_cache_cli(
@@ -487,7 +1464,7 @@ class user(_Data):
         if _Data._local:
             return constants.ConductoPaths.get_local_base_dir(expand=False) + "/data/"
         else:
-            credentials = _get_credentials(_Data._token)
+            credentials = _S3Session.get(_Data._token).credentials()
             return f"s3://{_Data._s3_bucket}/{credentials['IdentityId']}/data/"
 
     #####
@@ -504,12 +1481,19 @@ class user(_Data):
             "get": cls._get_cli,
             "gets": cls._gets_cli,
             "list": cls._list_cli,
+            "iter-list": cls._iter_list_cli,
             "put": cls._put_cli,
             "puts": cls._puts_cli,
             "size": cls._size_cli,
             "url": cls._url_cli,
             "cache-exists": cls._cache_exists_cli,
             "clear-cache": cls._clear_cache_cli,
+            "gc-cache": cls._gc_cache_cli,
+            "exists-many": cls._exists_many_cli,
+            "size-many": cls._size_many_cli,
+            "get-many": cls._get_many_cli,
+            "put-many": cls._put_many_cli,
+            "delete-many": cls._delete_many_cli,
             "save-cache": cls._save_cache_cli,
             "restore-cache": cls._restore_cache_cli,
         }
@@ -555,7 +1539,23 @@ class user(_Data):
         Return names of objects that start with `prefix`.
         """
         cls._init(local=local)
-        return cls.list(prefix)
+        _print_json_array(cls.list(prefix))
+
+    @classmethod
+    def _iter_list_cli(
+        cls,
+        prefix="",
+        delimiter=None,
+        non_recursive: bool = False,
+        *,
+        local: bool = None,
+    ):
+        """
+        Print the name, size and mtime of each object that starts with `prefix`, one
+        JSON object per line, as they are listed. `--non-recursive` stops at "/".
+        """
+        cls._init(local=local)
+        _print_json_lines(cls.iter_list(prefix, delimiter, not non_recursive))
 
     @classmethod
     def _put_cli(cls, name, file, *, local: bool = None):
@@ -610,12 +1610,66 @@ class user(_Data):
         return cls.clear_cache(name, checksum)
 
     @classmethod
-    def _save_cache_cli(cls, name, checksum, save_dir, *, local: bool = None):
+    def _gc_cache_cli(cls, grace_secs: int = 3600, *, local: bool = None):
         """
-        Save `save_dir` to cache at `name` with `checksum`.
+        Delete cache chunks that no cache refers to and are older than `grace_secs`.
+        """
+        cls._init(local=local)
+        return cls.gc_cache(grace_secs)
+
+    @classmethod
+    def _exists_many_cli(cls, *, local: bool = None):
+        """
+        Read names from stdin, one per line, and test if there is an object at each.
+        """
+        cls._init(local=local)
+        names = _read_stdin_lines()
+        return dict(zip(names, cls.exists_many(names)))
+
+    @classmethod
+    def _size_many_cli(cls, *, local: bool = None):
+        """
+        Read names from stdin, one per line, and return the size of each, in bytes.
+        """
+        cls._init(local=local)
+        names = _read_stdin_lines()
+        return dict(zip(names, cls.size_many(names)))
+
+    @classmethod
+    def _get_many_cli(cls, *, local: bool = None):
+        """
+        Read lines of `name<TAB>file` from stdin. Get each object at `name` and store
+        it to `file`.
+        """
+        cls._init(local=local)
+        return cls.get_many(_read_stdin_pairs())
+
+    @classmethod
+    def _put_many_cli(cls, *, local: bool = None):
+        """
+        Read lines of `name<TAB>file` from stdin. Store each object in `file` to
+        `name`.
+        """
+        cls._init(local=local)
+        return cls.put_many(_read_stdin_pairs())
+
+    @classmethod
+    def _delete_many_cli(cls, *, local: bool = None):
+        """
+        Read names from stdin, one per line, and delete the object at each.
         """
         cls._init(local=local)
-        return cls.save_cache(name, checksum, save_dir)
+        return cls.delete_many(_read_stdin_lines())
+
+    @classmethod
+    def _save_cache_cli(
+        cls, name, checksum, save_dir, *, codec=None, local: bool = None
+    ):
+        """
+        Save `save_dir` to cache at `name` with `checksum`, compressed with `codec`.
+        """
+        cls._init(local=local)
+        return cls.save_cache(name, checksum, save_dir, codec=codec)
 
     @classmethod
     def _restore_cache_cli(cls, name, checksum, restore_dir, *, local: bool = None):
@@ -634,6 +1688,467 @@ class user(_Data):
         print(json.dumps(val))
 
 
+# Manifests list the chunks of a cache's archive in the shared chunk store, which
+# is kept under conducto-cache/ with a name that caches can't use.
+_CACHE_MANIFEST_VERSION = 4
+_CACHE_CHUNK_SIZE = 4 * 2 ** 20
+_CACHE_RESERVED_NAME = "_chunks"
+_CACHE_CHUNK_DIR = f"conducto-cache/{_CACHE_RESERVED_NAME}"
+# When clear_cache last ran gc_cache.
+_CACHE_GC_TIME_PATH = f"{_CACHE_CHUNK_DIR}/_gc_time"
+_CACHE_GC_INTERVAL = 24 * 3600
+
+
+def _check_cache_name(name):
+    if name.split("/", 1)[0] == _CACHE_RESERVED_NAME:
+        raise ValueError(
+            f"Cache names can't start with {_CACHE_RESERVED_NAME}, which holds the "
+            f"chunks of every cache. Got {repr(name)}."
+        )
+
+
+def _get_chunk_path(digest, codec):
+    return f"{_CACHE_CHUNK_DIR}/{digest[:2]}/{digest}.{codec}"
+
+
+class _Codec:
+    AUTO = "auto"
+    GZIP = "gzip"
+    ZSTD = "zstd"
+    NONE = "none"
+    all = [AUTO, GZIP, ZSTD, NONE]
+
+
+def _have_zstd():
+    return importlib.util.find_spec("zstandard") is not None
+
+
+def _get_cache_codec(codec, level):
+    config = api.Config()
+    if codec is None:
+        codec = config.get("config", "cache_codec", _Codec.AUTO)
+    if codec not in _Codec.all:
+        raise ValueError(f"Unknown cache codec {repr(codec)}. Use one of {_Codec.all}")
+    if codec == _Codec.AUTO:
+        codec = _Codec.ZSTD if _have_zstd() else _Codec.GZIP
+    if level is None:
+        level = config.get("config", "cache_compress_level")
+    if level is None:
+        level = {_Codec.GZIP: 6, _Codec.ZSTD: 3}.get(codec)
+    return codec, None if level is None else int(level)
+
+
+def _get_compress_fxn(codec, level):
+    if codec == _Codec.GZIP:
+        import gzip
+
+        return functools.partial(gzip.compress, compresslevel=level, mtime=0)
+    elif codec == _Codec.ZSTD:
+        import zstandard
+
+        # ZstdCompressor isn't thread-safe, so make a new one for each chunk.
+        return lambda data: zstandard.ZstdCompressor(level=level).compress(data)
+    elif codec == _Codec.NONE:
+        return bytes
+    raise ValueError(f"Unknown cache codec {repr(codec)}")
+
+
+def _get_decompress_fxn(codec):
+    if codec == _Codec.GZIP:
+        import gzip
+
+        return gzip.decompress
+    elif codec == _Codec.ZSTD:
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError(
+                "This cache was compressed with zstd. Install the 'zstandard' package "
+                "to restore it."
+            )
+        return lambda data: zstandard.ZstdDecompressor().decompress(data)
+    elif codec == _Codec.NONE:
+        return bytes
+    raise ValueError(f"Unknown cache codec {repr(codec)}")
+
+
+class _ContentDefinedChunker(io.RawIOBase):
+    """
+    Writable stream that splits what is written to it into content-defined chunks
+    and passes each to `on_chunk(data)`. Every byte is mapped to a 0 or 1 by a
+    fixed table, and a chunk ends after the first run of `run_length` ones that
+    ends at least `min_size` bytes into it, or at `max_size` if there is none.
+    A boundary depends only on the `run_length` bytes before it, so inserting or
+    removing bytes only moves the boundaries next to the edit, and the chunks
+    after those are the same as before. For random bytes the expected chunk size
+    is `min_size` plus about 2 ** (run_length + 1).
+
+    This serves the same purpose as a gear or Rabin rolling hash. The table
+    lookup and the search for the run are done by bytes.translate() and
+    bytes.find(), which are fast enough for large caches, unlike a rolling hash
+    updated in Python for every byte.
+    """
+
+    def __init__(self, on_chunk, min_size=2 ** 18, max_size=8 * 2 ** 20, run_length=19):
+        super().__init__()
+        self.on_chunk = on_chunk
+        self.min_size = min_size
+        self.max_size = max_size
+        self._run = b"\x01" * run_length
+        self._table = _chunk_bit_table()
+        self._buf = bytearray()
+        # How much of _buf has been searched without finding a boundary.
+        self._searched = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._buf += b
+        while self._cut():
+            pass
+        return len(b)
+
+    def _cut(self):
+        k = len(self._run)
+        end = min(len(self._buf), self.max_size)
+        # A run may straddle what was searched before and what was just written.
+        start = max(self._searched - (k - 1), self.min_size - k, 0)
+        if end - start >= k:
+            i = self._buf[start:end].translate(self._table).find(self._run)
+            if i >= 0:
+                self._emit(start + i + k)
+                return True
+            self._searched = end
+        if len(self._buf) >= self.max_size:
+            self._emit(self.max_size)
+            return True
+        return False
+
+    def _emit(self, size):
+        data = bytes(self._buf[:size])
+        del self._buf[:size]
+        self._searched = 0
+        self.on_chunk(data)
+
+    def close(self):
+        if not self.closed and self._buf:
+            self._emit(len(self._buf))
+        super().close()
+
+
+@functools.lru_cache(maxsize=None)
+def _chunk_bit_table():
+    # Maps half of the byte values, picked by a fixed hash, to 1 and the rest to 0.
+    # It must never change, or chunks saved before would no longer be found.
+    order = sorted(range(256), key=lambda i: hashlib.blake2b(bytes([i])).digest())
+    ones = set(order[:128])
+    return bytes(1 if i in ones else 0 for i in range(256))
+
+
+class _ReadCache:
+    """
+    Optional on-disk read-through cache for objects read from S3 with get() and
+    gets(), so that many nodes on one host reading the same objects only download
+    them once. Entries are keyed by bucket, key and ETag; every read revalidates
+    the ETag with a HEAD request. The least recently used entries are removed once
+    the total exceeds `max_bytes`. Downloads and eviction are guarded by file locks,
+    so concurrent processes can share the cache. gets() returns a copy of a hit,
+    but open() maps it with mmap, so readers on the host share its pages instead of
+    each holding a copy, and get() copies it without reading it into this process.
+
+    Enable it with the `data_read_cache` option in the `[config]` section or the
+    `CONDUCTO_DATA_READ_CACHE` environment variable, and size it with
+    `data_read_cache_max_bytes`.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, dirname, max_bytes):
+        self.dirname = dirname
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_config(cls) -> typing.Optional["_ReadCache"]:
+        with cls._instance_lock:
+            if cls._instance is None:
+                config = api.Config()
+                enabled = os.getenv("CONDUCTO_DATA_READ_CACHE") or config.get(
+                    "config", "data_read_cache"
+                )
+                if not t.Bool(enabled):
+                    cls._instance = False
+                else:
+                    cls._instance = cls(
+                        os.path.join(
+                            constants.ConductoPaths.get_local_base_dir(),
+                            "data_read_cache",
+                        ),
+                        int(config.get("config", "data_read_cache_max_bytes", 2 ** 30)),
+                    )
+            return cls._instance or None
+
+    def fetch(self, client, bucket, key, download=True) -> typing.Optional[str]:
+        """
+        Return the path of the cached copy of the current version of the object, or
+        None if it isn't cached and either `download` is False or the object is too
+        big to cache.
+        """
+        head = client.head_object(Bucket=bucket, Key=key)
+        key_hash = hashlib.sha1(f"{bucket}/{key}".encode()).hexdigest()
+        etag_hash = hashlib.sha1(head["ETag"].encode()).hexdigest()
+        path = os.path.join(self.dirname, f"{key_hash}-{etag_hash}")
+
+        if self._touch(path):
+            return path
+        if not download or head["ContentLength"] > self.max_bytes:
+            return None
+
+        os.makedirs(self.dirname, exist_ok=True)
+        # Lock files are shared by all keys with the same first two hex digits, so
+        # there are at most 256 of them.
+        with self._lock(key_hash[:2]):
+            # Another process may have downloaded it while we waited for the lock.
+            if self._touch(path):
+                return path
+            self._download(client, bucket, key, head, path)
+            # Remove older versions of this object.
+            with os.scandir(self.dirname) as it:
+                for de in it:
+                    if de.name.startswith(key_hash + "-") and de.path != path:
+                        with contextlib.suppress(OSError):
+                            os.remove(de.path)
+        self._evict()
+        return path
+
+    def read(self, client, bucket, key, read_fxn, download=True):
+        """
+        Return `(True, read_fxn(path))` for the path of the cached copy of the
+        object, or `(False, None)` if it isn't cached, like fetch(). Another process
+        may evict the entry before `read_fxn` opens it, so then it is fetched once
+        more before giving up.
+        """
+        for _ in range(2):
+            path = self.fetch(client, bucket, key, download=download)
+            if path is None:
+                break
+            try:
+                return True, read_fxn(path)
+            except FileNotFoundError:
+                continue
+        return False, None
+
+    @staticmethod
+    def _touch(path):
+        # Mark the entry as recently used, if it exists.
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def _download(self, client, bucket, key, head, path):
+        import shutil
+
+        part_size, concurrency = _get_transfer_settings()
+        # _RangedReader pins every request to the ETag we looked up.
+        reader = _RangedReader(client, bucket, key, part_size, concurrency, head)
+        with reader, file_utils.atomic_write(path) as f:
+            shutil.copyfileobj(reader, f, part_size)
+
+    @contextlib.contextmanager
+    def _lock(self, name):
+        with open(os.path.join(self.dirname, name + ".lock"), "a") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _evict(self):
+        # Readers that already opened an evicted file can keep reading it.
+        with self._lock("evict"):
+            file_utils.evict_lru(self.dirname, self.max_bytes)
+
+
+def _read_file(path, byte_range=None) -> bytes:
+    with open(path, "rb") as f:
+        if not byte_range:
+            return f.read()
+        begin, end = byte_range
+        if end <= begin:
+            return b""
+        f.seek(begin)
+        return f.read(end - begin)
+
+
+class _ChunkCache:
+    """
+    Compressed cache chunks fetched from S3, kept under ~/.conducto so restoring a
+    cache only downloads chunks that aren't already here. The least recently used
+    chunks are removed once the total exceeds `max_bytes`.
+    """
+
+    def __init__(self, dirname, max_bytes):
+        self.dirname = dirname
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_config(cls):
+        return cls(
+            os.path.join(constants.ConductoPaths.get_local_base_dir(), "cache_chunks"),
+            int(api.Config().get("config", "cache_chunk_cache_max_bytes", 2 * 2 ** 30)),
+        )
+
+    def _path(self, digest, codec):
+        return os.path.join(self.dirname, f"{digest}.{codec}")
+
+    def get(self, digest, codec):
+        path = self._path(digest, codec)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def put(self, digest, codec, data):
+        with contextlib.suppress(OSError):
+            with file_utils.atomic_write(self._path(digest, codec)) as f:
+                f.write(data)
+
+    def evict(self):
+        file_utils.evict_lru(self.dirname, self.max_bytes)
+
+
+class ListEntry(typing.NamedTuple):
+    name: str
+    # Both are None for common prefixes when listing with a delimiter.
+    size: typing.Optional[int]
+    mtime: typing.Optional[float]
+
+
+def _iter_list_s3(ctx, prefix, delimiter, page_size):
+    import heapq
+
+    prefix_size = len(ctx.get_s3_key(""))
+    kwargs = {
+        "Bucket": ctx.bucket,
+        "Prefix": ctx.get_s3_key(prefix),
+        "PaginationConfig": {"PageSize": page_size},
+    }
+    if delimiter is not None:
+        kwargs["Delimiter"] = delimiter
+    paginator = ctx.s3_client.get_paginator("list_objects_v2")
+    for page in paginator.paginate(**kwargs):
+        objects = (
+            ListEntry(
+                obj["Key"][prefix_size:], obj["Size"], obj["LastModified"].timestamp()
+            )
+            for obj in page.get("Contents", [])
+        )
+        prefixes = (
+            ListEntry(cp["Prefix"][prefix_size:], None, None)
+            for cp in page.get("CommonPrefixes", [])
+        )
+        # Each is sorted, but S3 returns them separately.
+        yield from heapq.merge(objects, prefixes, key=lambda entry: entry.name)
+
+
+def _iter_list_local(ctx, prefix, delimiter):
+    # `prefix` is a prefix of names, not necessarily a directory, so scan the
+    # directory it is in for entries that start with the rest of it.
+    dirname, _, leaf = prefix.rpartition("/")
+    base = dirname + "/" if dirname else ""
+    yield from _scan_local(ctx.get_path(dirname), base, leaf, delimiter)
+
+
+def _scan_local(dirpath, base, leaf, delimiter):
+    try:
+        with os.scandir(dirpath) as it:
+            entries = [
+                (de.name + "/" if de.is_dir(follow_symlinks=False) else de.name, de)
+                for de in it
+                if de.name.startswith(leaf)
+            ]
+    except (FileNotFoundError, NotADirectoryError):
+        return
+    # Sorting directories with a trailing "/" puts the names in the same order as
+    # S3 would.
+    entries.sort(key=lambda pair: pair[0])
+    for sort_name, de in entries:
+        name = base + sort_name
+        if not sort_name.endswith("/"):
+            st = de.stat()
+            yield ListEntry(name, st.st_size, st.st_mtime)
+        elif delimiter == "/":
+            # Like S3, only report prefixes that contain something.
+            with os.scandir(de.path) as it:
+                if next(it, None) is not None:
+                    yield ListEntry(name, None, None)
+        else:
+            yield from _scan_local(de.path, name, "", delimiter)
+
+
+def _map_concurrently(fxn, items):
+    # Like map(), but runs up to `data_max_concurrency` calls at once. Results are
+    # in the same order as `items`, and the first exception is raised.
+    _part_size, concurrency = _get_transfer_settings()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+        return list(executor.map(fxn, items))
+
+
+def _delete_s3_keys(ctx, keys):
+    # DeleteObjects accepts at most 1000 keys per request.
+    keys = list(keys)
+    for i in range(0, len(keys), 1000):
+        result = ctx.s3_client.delete_objects(
+            Bucket=ctx.bucket,
+            Delete={
+                "Objects": [{"Key": key} for key in keys[i : i + 1000]],
+                "Quiet": True,
+            },
+        )
+        errors = result.get("Errors")
+        if errors:
+            raise IOError(
+                f"Failed to delete {len(errors)} object(s). First error: {errors[0]}"
+            )
+
+
+def _print_json_array(items):
+    # Same output as printing json.dumps(list(items)), but written as it goes.
+    sep = "["
+    for item in items:
+        sys.stdout.write(sep + json.dumps(item))
+        sep = ", "
+    print("[]" if sep == "[" else "]", flush=True)
+
+
+def _print_json_lines(entries):
+    for entry in entries:
+        print(json.dumps(entry._asdict()))
+    sys.stdout.flush()
+
+
+def _read_stdin_lines():
+    return [line for line in sys.stdin.read().splitlines() if line]
+
+
+def _read_stdin_pairs():
+    pairs = []
+    for line in _read_stdin_lines():
+        name, sep, file = line.partition("\t")
+        if not sep:
+            raise ValueError(f"Expected 'name<TAB>file' but got {repr(line)}")
+        pairs.append((name, file))
+    return pairs
+
+
 def _safe_join(*parts):
     parts = list(parts)
     parts[1:] = [p.lstrip(os.path.sep) for p in parts[1:]]
@@ -358,6 +358,104 @@ def beautify(function, name, space):
     return name + params + parse_docstring()
 
 
+def _dispatch_fast(methods, argv, printer):
+    """
+    Call the method named by `argv` directly if it is a plain function call with
+    only `--name=value`, `--flag` and `--no-flag` arguments that main() would parse
+    the same way. Return `(handled, output)`; if not handled, main() runs as usual,
+    including for help, errors and methods that return a Node.
+    """
+    if not argv or argv[0] not in methods:
+        return False, None
+    func = methods[argv[0]]
+    spec = _get_arg_spec(func)
+    if spec is None:
+        return False, None
+
+    values = {}
+    for a in argv[1:]:
+        if not a.startswith("--"):
+            return False, None
+        key, eq, value = a[2:].partition("=")
+        entry = spec.get(key)
+        if eq:
+            if entry is None or entry[1] in (bool, t.Bool):
+                return False, None
+        elif entry is not None and entry[1] in (bool, t.Bool):
+            value = True
+        elif key[3:] in spec and key.startswith("no-"):
+            entry = spec[key[3:]]
+            if entry[1] not in (bool, t.Bool):
+                return False, None
+            value = False
+        else:
+            return False, None
+        # Let argparse report conflicts like `--flag --no-flag`.
+        if entry[0] in values:
+            return False, None
+        values[entry[0]] = value
+
+    for name, typ, required in spec.values():
+        if name in values:
+            continue
+        if required:
+            return False, None
+        # main() parses an omitted bool as False, because of its --no- option.
+        if typ in (bool, t.Bool):
+            values[name] = False
+
+    try:
+        return_type = typing.get_type_hints(func).get("return")
+    except Exception:
+        return False, None
+    if isinstance(return_type, type) and issubclass(return_type, pipeline.Node):
+        return False, None
+
+    call_state = {
+        name: arg.Base(name, defaultType=spec[name][1]).parseCL(value)
+        for name, value in values.items()
+    }
+    wrapper = Wrapper.get_or_create(func)
+    output = func(**wrapper.getCallArgs(**call_state))
+    if inspect.isawaitable(output):
+        output = asyncio.get_event_loop().run_until_complete(output)
+    if output is not None:
+        printer(output)
+    return True, output
+
+
+def _get_arg_spec(func):
+    """
+    Return how main() parses command-line options for `func`, as a dict from each
+    option name (without "--") to `(param_name, type, required)`, or None if it
+    takes *args or **kwargs. This is computed once per function and kept on it, or
+    it can be precomputed by setting `func._conducto_arg_spec`.
+    """
+    spec = getattr(func, "_conducto_arg_spec", _UNSET)
+    if spec is not _UNSET:
+        return spec
+    spec = {}
+    for param_name, sig in inspect.signature(func).parameters.items():
+        if sig.kind in (sig.VAR_POSITIONAL, sig.VAR_KEYWORD):
+            spec = None
+            break
+        if sig.annotation != inspect.Parameter.empty:
+            typ = arg._wrap_type(sig.annotation)
+        elif sig.default != inspect.Parameter.empty:
+            typ = sig.default.__class__
+        else:
+            typ = str
+        entry = (param_name, typ, sig.default == inspect.Parameter.empty)
+        spec[param_name] = entry
+        if "_" in param_name:
+            spec[param_name.replace("_", "-")] = entry
+    try:
+        func._conducto_arg_spec = spec
+    except (AttributeError, TypeError):
+        pass
+    return spec
+
+
 def _get_calling_filename():
     """
     Iterate through the stack to find the filename that is actually being
@@ -462,6 +560,12 @@ def main(
             func: methods[func] for func in variables["__all__"] if func in methods
         }
 
+    # Workers run one function per process, e.g. `conducto FILE func --x=1` for an
+    # Exec made from a Python function, so skip the usage text and full parser.
+    handled, output = _dispatch_fast(methods, argv, printer)
+    if handled:
+        return output
+
     returns_node = []
     doesnt_return_node = []
 
@@ -718,8 +822,12 @@ def main(
                 # Variable is set in conducto_worker/__main__.py to avoid
                 # printing ugly serialization when not needed.
                 simplify_attributes(output)
-                s = output.serialize()
-                print(f"<__conducto_serialization>{s}</__conducto_serialization>\n")
+                # Hash the images of the subtree here, like Node._build() does, so
+                # that their names are serialized with it.
+                image_mod.compute_content_hashes(output, skip_missing=True)
+                sys.stdout.write("<__conducto_serialization>")
+                output.serialize_to(sys.stdout)
+                sys.stdout.write("</__conducto_serialization>\n\n")
             print(output.pretty(strict=False))
     elif output is not None:
         printer(output)
@@ -5,6 +5,7 @@ import functools
 import hashlib
 import json
 import os
+import signal
 import subprocess
 import sys
 import time
@@ -12,11 +13,16 @@ import traceback
 import typing
 import uuid
 import warnings
+import weakref
 
 import conducto.internal.host_detection as hostdet
 from conducto.shared import async_utils, client_utils, log
-from .. import pipeline
-from . import dockerfile as dockerfile_mod, names
+from .._version import __version__
+from . import dockerfile as dockerfile_mod, hashing
+
+if typing.TYPE_CHECKING:
+    # Only for annotations. pipeline imports this module to define Node.
+    from .. import pipeline
 
 
 def relpath(path):
@@ -65,6 +71,10 @@ class Status:
     ]
 
 
+# How long to wait for `git ls-remote` to find the commit of a copy_url.
+_GIT_TIMEOUT_SECS = 30
+
+
 class Repository:
     """A collection of images with different names"""
 
@@ -94,10 +104,18 @@ class Repository:
         return img
 
     def add(self, image):
-        if image.name in self.images and self.images[image.name] != image:
+        existing = self.images.get(image.name)
+        if existing is not None and existing != image:
             raise self.DuplicateImageError(
                 f"{image.name} already present with a different definition in this repository"
             )
+        if (
+            existing is not None
+            and existing._content_hashes is not None
+            and image._content_hashes is None
+        ):
+            # Keep the one whose names are already known.
+            return
         self.images[image.name] = image
 
     def merge(self, repo):
@@ -157,10 +175,13 @@ class Image:
         path_map=None,
         name=None,
         pre_built=False,
+        content_hashes=None,
         **kwargs,
     ):
 
         if name is None:
+            from . import names
+
             name = names.NameGenerator.name()
 
         self.name = name
@@ -234,9 +255,18 @@ class Image:
             self.history.append(HistoryEntry(Status.DONE, finish=True))
 
         self._make_fut: typing.Optional[asyncio.Future] = None
+        # Set when the Image is rebuilt from to_dict(), so that its names stay those
+        # it was given where it was first hashed.
+        self._content_hashes = content_hashes
 
     def __eq__(self, other):
-        return isinstance(other, Image) and self.to_dict() == other.to_dict()
+        # The content hashes are derived from the rest, and may not be computed yet.
+        return isinstance(other, Image) and self._eq_dict() == other._eq_dict()
+
+    def _eq_dict(self):
+        d = self.to_dict()
+        del d["content_hashes"]
+        return d
 
     # hack to get this to serialize
     @property
@@ -257,8 +287,25 @@ class Image:
             "reqs_py": self.reqs_py,
             "path_map": self.path_map,
             "pre_built": self.pre_built,
+            "content_hashes": self._content_hashes,
         }
 
+    @classmethod
+    def _from_dict(cls, d):
+        """
+        Rebuild an Image from to_dict(). Its paths were resolved when it was first
+        made, so they are restored as they are rather than resolved again.
+        """
+        d = dict(d)
+        img = cls.__new__(cls)
+        img._content_hashes = d.pop("content_hashes", None)
+        img.__dict__.update(d)
+        img.history = [HistoryEntry(Status.PENDING)]
+        if img.pre_built:
+            img.history.append(HistoryEntry(Status.DONE, finish=True))
+        img._make_fut = None
+        return img
+
     def to_raw_image(self):
         return {
             "image": self.image,
@@ -332,19 +379,128 @@ class Image:
     @property
     def name_built(self):
         if self.needs_building():
-            key = json.dumps(self.to_raw_image()).encode()
-            return "conducto_built:" + hashlib.md5(key).hexdigest()
+            return "conducto_built:" + self._get_content_hashes()["built"]
         else:
             return self.image
 
     @property
     def name_complete(self):
         if self.needs_completing():
-            key = json.dumps(self.to_raw_image()).encode()
-            return "conducto_complete:" + hashlib.md5(key).hexdigest()
+            return "conducto_complete:" + self._get_content_hashes()["complete"]
         else:
             return self.name_built
 
+    def _get_content_hashes(self):
+        # Building the pipeline and make() compute these ahead of time, and they are
+        # serialized with the Image. Images that weren't hashed where they were
+        # defined, like those of a Lazy subtree, are hashed on first use.
+        if self._content_hashes is None:
+            loop = asyncio.get_event_loop()
+            if not loop.is_running():
+                loop.run_until_complete(self._compute_content_hashes())
+            else:
+                # Can't wait on the running loop, so hash on a loop of its own.
+                with concurrent.futures.ThreadPoolExecutor(1) as executor:
+                    executor.submit(
+                        asyncio.run, self._compute_content_hashes()
+                    ).result()
+        return self._content_hashes
+
+    async def _compute_content_hashes(self):
+        """
+        Hash everything that goes into the built and completed images, not just
+        their config: the Dockerfile and its context, the copy_dir tree, and the
+        commit that copy_url/copy_branch point to. Computed once per Image, where it
+        is built, and serialized with it, so that the names can be reproduced
+        anywhere.
+        """
+        if self._content_hashes is not None:
+            return self._content_hashes
+
+        # Hashing the trees reads files, so keep it off the event loop.
+        loop = asyncio.get_event_loop()
+        built, complete = await loop.run_in_executor(None, self._hash_files)
+        commit = None
+        if self.copy_url is not None:
+            commit = await self._get_copy_url_commit()
+            if commit is None:
+                # Can't tell what would be cloned, so never reuse an old image.
+                log.warn(
+                    f"Could not find the commit of {self.copy_branch} in "
+                    f"{self.copy_url}. Image {self.name} will be rebuilt."
+                )
+                commit = str(uuid.uuid4())
+            complete.update(commit.encode())
+
+        if self._content_hashes is None:
+            self._content_hashes = {
+                "built": built.hexdigest(),
+                "complete": complete.hexdigest(),
+                "commit": commit,
+            }
+        return self._content_hashes
+
+    def _hash_files(self):
+        built = hashlib.md5(json.dumps(self.to_raw_image()).encode())
+        if self.needs_building():
+            built.update(self._digest(self.dockerfile, hashing.file_digest))
+            built.update(self._digest(self.context, hashing.tree_digest))
+
+        complete = hashlib.md5(built.digest())
+        # text_for_build_dockerfile installs this version of conducto.
+        complete.update(__version__.encode())
+        if self.copy_dir is not None:
+            complete.update(self._digest(self.copy_dir, hashing.tree_digest))
+        return built, complete
+
+    def _digest(self, path, digest_fxn):
+        path = Image.PATH_PREFIX + path
+        if not os.path.exists(path):
+            # The image couldn't be built from here either, so no name would match it.
+            raise FileNotFoundError(
+                f"{path} does not exist, so image {self.name} can't be hashed."
+            )
+        if digest_fxn is hashing.tree_digest:
+            # Docker leaves out what .dockerignore excludes from the build context.
+            return digest_fxn(path, hashing.DockerIgnore.from_dir(path)).encode()
+        return digest_fxn(path).encode()
+
+    async def _get_copy_url_commit(self):
+        # Never wait for a password: not on the terminal, which git would hold up
+        # the build for, and not from ssh. Also give up on an unresponsive remote.
+        env = dict(os.environ, GIT_TERMINAL_PROMPT="0")
+        env.setdefault("GIT_SSH_COMMAND", "ssh -o BatchMode=yes")
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                "git",
+                "ls-remote",
+                self.copy_url,
+                f"refs/heads/{self.copy_branch}",
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                env=env,
+                # In its own process group, so that ssh and the other helpers it runs
+                # can be killed with it.
+                start_new_session=True,
+            )
+        except OSError:
+            return None
+        try:
+            out, _err = await asyncio.wait_for(proc.communicate(), _GIT_TIMEOUT_SECS)
+        except asyncio.TimeoutError:
+            with contextlib.suppress(ProcessLookupError):
+                if hasattr(os, "killpg"):
+                    os.killpg(proc.pid, signal.SIGKILL)
+                else:
+                    proc.kill()
+            await proc.wait()
+            return None
+        if proc.returncode != 0:
+            return None
+        out = out.decode()
+        return out.split()[0] if out.strip() else None
+
     @property
     def name_local_extended(self):
         return (
@@ -375,12 +531,16 @@ class Image:
                 return h.stdout
         return None
 
-    async def make(self, push_to_cloud, callback=lambda: None):
+    async def make(self, push_to_cloud, callback=lambda: None, scheduler=None):
         # Only call _make() once, and all other calls should just return the
         # same result.
 
         if self._make_fut is None:
-            self._make_fut = asyncio.ensure_future(self._make(push_to_cloud, callback))
+            if scheduler is None:
+                scheduler = _default_scheduler()
+            self._make_fut = asyncio.ensure_future(
+                self._make(push_to_cloud, callback, scheduler)
+            )
         is_already_done = self._make_fut.done()
         try:
             await self._make_fut
@@ -390,58 +550,124 @@ class Image:
             if not is_already_done:
                 callback()
 
-    async def _make(self, push_to_cloud, callback):
-        async for _ in self._make_generator(push_to_cloud, callback):
+    async def _make(self, push_to_cloud, callback, scheduler):
+        await self._compute_content_hashes()
+        async for _ in self._make_generator(push_to_cloud, callback, scheduler):
             pass
 
-    async def _make_generator(self, push_to_cloud, callback):
+    async def _make_generator(self, push_to_cloud, callback, scheduler):
         """
         Generator that pulls/builds/extends/pushes this Image.
         """
         assert len(self.history) == 1 and self.history[0].status == Status.PENDING
         self.history[0].finish()
 
+        # Make the images of the pipeline that this one is built on first.
+        for dep in scheduler.dependencies.get(self.name_complete, ()):
+            await dep.make(push_to_cloud, callback, scheduler)
+
+        # If the completed image is already here, and was made from the images it is
+        # based on as they are now, skip straight to extending it.
+        up_to_date = await self._is_up_to_date()
+
         # Pull the image if needed
-        if self.image and "/" in self.image:
-            with self._new_status(Status.PULLING) as st:
-                callback()
-                out, err = await async_utils.run_and_check("docker", "pull", self.image)
-                st.finish(out, err)
+        if not up_to_date:
+            for tag in self._pulls(scheduler.pulls):
+                pull = functools.partial(
+                    async_utils.run_and_check, "docker", "pull", tag
+                )
+                await self._run_phase(scheduler, Status.PULLING, tag, pull, callback)
         yield
 
         # Build the image if needed
-        if self.needs_building():
-            with self._new_status(Status.BUILDING) as st:
-                callback()
-                out, err = await self._build()
-                st.finish(out, err)
+        if not up_to_date and self.needs_building():
+            await self._run_phase(
+                scheduler, Status.BUILDING, self.name_built, self._build, callback
+            )
         yield
 
         # If needed, copy files into the image and install packages
-        if self.needs_completing():
-            with self._new_status(Status.COMPLETING) as st:
-                callback()
-                out, err = await self._complete()
-                st.finish(out, err)
+        if not up_to_date and self.needs_completing():
+            await self._run_phase(
+                scheduler,
+                Status.COMPLETING,
+                self.name_complete,
+                self._complete,
+                callback,
+            )
         yield
 
-        with self._new_status(Status.EXTENDING) as st:
-            callback()
-            out, err = await self._extend()
-            st.finish(out, err)
+        await self._run_phase(
+            scheduler,
+            Status.EXTENDING,
+            self.name_local_extended,
+            self._extend,
+            callback,
+        )
         yield
 
         if push_to_cloud:
-            with self._new_status(Status.PUSHING) as st:
-                callback()
-                out, err = await self._push()
-                st.finish(out, err)
+            await self._run_phase(
+                scheduler,
+                Status.PUSHING,
+                self.name_cloud_extended,
+                self._push,
+                callback,
+            )
 
         self.history.append(HistoryEntry(Status.DONE, finish=True))
 
+    async def _is_up_to_date(self):
+        """
+        Return whether name_complete exists locally and every step to it would be
+        skipped. A registry base that has changed upstream isn't noticed until it is
+        pulled again.
+        """
+        if self.needs_building() and not await _is_made_from(
+            self.name_built, self._build_bases()
+        ):
+            return False
+        if self.needs_completing():
+            return await self._is_completed()
+        return await _image_exists(self.name_complete)
+
+    def _build_bases(self):
+        return _dockerfile_bases(Image.PATH_PREFIX + self.dockerfile)
+
+    async def _is_completed(self):
+        # Unpinned packages can have new versions, so they are always installed again.
+        if dockerfile_mod.unpinned_reqs(self.reqs_py):
+            return False
+        return await _is_made_from(self.name_complete, [self.name_built])
+
+    def _pulls(self, shared):
+        """
+        Return the tags to pull before building: the base `image` if it comes from a
+        registry, and the bases in the Dockerfile's FROM lines that are among the
+        `shared` tags pulled for other images.
+        """
+        pulls = []
+        if self.image and "/" in self.image:
+            pulls.append(self.image)
+        if self.dockerfile is not None and shared:
+            for base in _dockerfile_bases(Image.PATH_PREFIX + self.dockerfile):
+                if base in shared and base not in pulls:
+                    pulls.append(base)
+        return pulls
+
+    async def _run_phase(self, scheduler, status, key, fxn, callback):
+        # The entry is queued until the scheduler lets the step run.
+        with self._new_status(status, queued=True) as st:
+            callback()
+            out, err = await scheduler.run(status, key, fxn, st, callback)
+            st.finish(out, err)
+
     @contextlib.contextmanager
-    def _new_status(self, status):
-        entry = HistoryEntry(status)
+    def _new_status(self, status, queued=False):
+        if queued:
+            entry = HistoryEntry(status, start=None)
+        else:
+            entry = HistoryEntry(status)
         self.history.append(entry)
         try:
             yield entry
@@ -481,6 +707,12 @@ class Image:
             Image.PATH_PREFIX + self.context,
         ]
 
+        # The name hashes the Dockerfile and its context but not the images it is
+        # FROM, so the IDs of those are recorded in a label and compared too.
+        bases = self._build_bases()
+        if await _is_made_from(self.name_built, bases):
+            return f"Image {self.name_built} is up to date.", None
+
         out, err = await async_utils.run_and_check(
             "docker",
             "build",
@@ -488,6 +720,8 @@ class Image:
             self.name_built,
             "--label",
             "conducto",
+            "--label",
+            f"{_BASES_LABEL}={await _base_ids(bases)}",
             *build_args,
         )
         return out, err
@@ -499,7 +733,20 @@ class Image:
             build_args = ["-f", "-", Image.PATH_PREFIX + self.copy_dir]
         else:
             build_args = ["-"]
-        build_args += ["--build-arg", f"CONDUCTO_CACHE_BUSTER={uuid.uuid4()}"]
+        # Only re-clone copy_url when the branch has moved to a new commit.
+        commit = self._get_content_hashes()["commit"]
+        if commit is not None:
+            build_args += ["--build-arg", f"CONDUCTO_CACHE_BUSTER={commit}"]
+
+        # Packages that aren't pinned to a version are installed again each time.
+        if dockerfile_mod.unpinned_reqs(self.reqs_py):
+            build_args += ["--build-arg", f"CONDUCTO_REQS_BUSTER={uuid.uuid4()}"]
+
+        # The name hashes the files and packages but not the image they are added
+        # to, so its ID is recorded in a label and compared too.
+        if await self._is_completed():
+            return f"Image {self.name_complete} is up to date.", None
+
         text = await dockerfile_mod.text_for_build_dockerfile(
             self.name_built,
             self.reqs_py,
@@ -516,6 +763,8 @@ class Image:
             self.name_complete,
             "--label",
             "conducto",
+            "--label",
+            f"{_BASES_LABEL}={await _base_ids([self.name_built])}",
             *build_args,
             input=text.encode(),
         )
@@ -575,42 +824,318 @@ class Image:
         )
 
 
+def compute_content_hashes(node: "pipeline.Node", skip_missing=False):
+    """
+    Compute the content hashes, which the names of built images are made from, of
+    all images in the tree under `node` at once. This is done before the tree is
+    serialized, so that the hashes come from the files here. With `skip_missing`,
+    images whose files aren't here are left to be hashed where they are built.
+    """
+
+    async def _compute(img):
+        try:
+            await img._compute_content_hashes()
+        except FileNotFoundError:
+            if not skip_missing:
+                raise
+
+    images = list(node.repo.images.values())
+    asyncio.get_event_loop().run_until_complete(
+        asyncio.gather(*(_compute(img) for img in images))
+    )
+
+
 def make_all(node: "pipeline.Node", push_to_cloud):
-    images = {}
-    for n in node.stream():
-        if n.user_set["image_name"]:
-            img = n.repo[n.user_set["image_name"]]
-            img.pre_built = True
-            if img.name_complete not in images:
-                images[img.name_complete] = img
+    compute_content_hashes(node)
+    images = _plan_images(node)
 
     def _print_status():
         line = "Preparing images:"
         sep = ""
         for status in Status.order:
-            count = sum(i.history[-1].status == status for i in images.values())
+            count = sum(_display_status(i) == status for i in images.values())
             if count > 0:
                 line += f"{sep} {count} {status}"
                 sep = ","
             print(f"\r{log.Control.ERASE_LINE}{line}", end=".", flush=True)
 
-    # Run all the builds concurrently.
-    # TODO: limit simultaneous builds using an asyncio.Semaphore
-    futs = [
-        img.make(push_to_cloud=push_to_cloud, callback=_print_status)
-        for img in images.values()
-    ]
-
-    asyncio.get_event_loop().run_until_complete(asyncio.gather(*futs))
+    # Images that share a base pull it once, before any of them is built on it,
+    # images built on other images of the pipeline wait for those, and each phase is
+    # limited to a configured number of simultaneous docker commands.
+    scheduler = BuildScheduler(
+        pulls=_pulled_tags(images.values()), dependencies=_image_dependencies(images),
+    )
+    asyncio.get_event_loop().run_until_complete(
+        asyncio.gather(
+            *(
+                img.make(
+                    push_to_cloud=push_to_cloud,
+                    callback=_print_status,
+                    scheduler=scheduler,
+                )
+                for img in images.values()
+            )
+        )
+    )
     print(f"\r{log.Control.ERASE_LINE}", end="", flush=True)
 
 
+def _plan_images(node: "pipeline.Node"):
+    """
+    Return the images used in the tree under `node`, keyed by name_complete. The
+    images are then marked as pre_built for serialization.
+    """
+    images = {}
+    for n in node.stream():
+        if n.user_set["image_name"]:
+            img = n.repo[n.user_set["image_name"]]
+            img.pre_built = True
+            if img.name_complete not in images:
+                images[img.name_complete] = img
+    return images
+
+
+async def _image_exists(name):
+    return await _image_id(name) is not None
+
+
+async def _image_id(name):
+    out, _err = await async_utils.run_and_check(
+        "docker", "image", "inspect", "--format", "{{.Id}}", name, stop_on_error=False
+    )
+    return out.decode().strip() or None
+
+
+# Label on built and completed images with the IDs of the images they were made
+# from, so that rebuilding or pulling one of those again remakes them.
+_BASES_LABEL = "conducto.bases"
+
+
+async def _base_ids(bases):
+    # Bases that aren't images here, like the names of build stages, count as empty.
+    ids = await asyncio.gather(*(_image_id(base) for base in bases))
+    return ",".join(i or "" for i in ids)
+
+
+async def _is_made_from(name, bases):
+    """Return whether image `name` exists and was made from `bases` as they are now."""
+    out, _err = await async_utils.run_and_check(
+        "docker",
+        "image",
+        "inspect",
+        "--format",
+        f'{{{{.Id}}}} {{{{index .Config.Labels "{_BASES_LABEL}"}}}}',
+        name,
+        stop_on_error=False,
+    )
+    image_id, _, label = out.decode().strip().partition(" ")
+    if not image_id:
+        return False
+    return label == await _base_ids(bases)
+
+
+def _display_status(img):
+    entry = img.history[-1]
+    if entry.start is None:
+        return Status.QUEUED
+    return entry.status
+
+
+def _image_dependencies(images):
+    """
+    Given the images from _plan_images(), return the images that each of them, by
+    name_complete, is built on: those whose built or completed name is its `image`
+    or a base in its Dockerfile. Raise ValueError if they depend on each other in a
+    cycle, which could never be built.
+    """
+    by_name = {}
+    for img in images.values():
+        # The names of images that aren't built are those of their bases, which
+        # other images can use without waiting for them.
+        if img.needs_building():
+            by_name[img.name_built] = img
+        if img.needs_completing():
+            by_name[img.name_complete] = img
+    dependencies = {}
+    for name, img in images.items():
+        bases = [img.image] if img.image else []
+        if img.needs_building():
+            bases += img._build_bases()
+        deps = []
+        for base in bases:
+            dep = by_name.get(base)
+            if dep is not None and dep is not img and dep not in deps:
+                deps.append(dep)
+        if deps:
+            dependencies[name] = deps
+
+    # Depth-first search for a cycle, from every image in turn.
+    done = set()
+    for start in dependencies:
+        path = [start]
+        stack = [iter(dependencies[start])]
+        while stack:
+            dep = next(stack[-1], None)
+            if dep is None:
+                done.add(path.pop())
+                stack.pop()
+                continue
+            name = dep.name_complete
+            if name in path:
+                raise ValueError(
+                    f"Images are built on each other in a cycle: "
+                    f"{' -> '.join(path[path.index(name):] + [name])}"
+                )
+            if name not in done:
+                path.append(name)
+                stack.append(iter(dependencies.get(name, ())))
+    return dependencies
+
+
+def _pulled_tags(images):
+    """Return the tags of the registry images that `images` are based on."""
+    return {img.image for img in images if img.image and "/" in img.image}
+
+
+def _dockerfile_bases(path):
+    try:
+        with open(path) as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+    bases = []
+    for line in lines:
+        parts = line.split()
+        if len(parts) >= 2 and parts[0].upper() == "FROM":
+            # Skip flags such as --platform=...
+            args = [p for p in parts[1:] if not p.startswith("--")]
+            if args:
+                bases.append(args[0])
+    return bases
+
+
+class BuildScheduler:
+    """
+    Runs the docker commands for each phase of preparing images, allowing at most a
+    configured number of them at once per phase. Steps are keyed by the image tag
+    they act on, so images that share a step (e.g., the same Dockerfile or base
+    image) only run it once and all wait on the same result. An image built on
+    another image of the pipeline waits for that one to be made first.
+
+    The limits default to `DEFAULT_LIMITS` and can be set per phase in the
+    `[config]` section of the Conducto config, e.g. `max_building = 4`.
+    """
+
+    DEFAULT_LIMITS = {
+        Status.PULLING: 4,
+        Status.BUILDING: 2,
+        Status.COMPLETING: 2,
+        Status.EXTENDING: 4,
+        Status.PUSHING: 2,
+    }
+
+    def __init__(self, limits=None, pulls=(), dependencies=None):
+        from .. import api
+
+        if limits is None:
+            config = api.Config()
+            limits = {}
+            for status, default in self.DEFAULT_LIMITS.items():
+                value = config.get("config", f"max_{status}", default)
+                try:
+                    limits[status] = int(value)
+                    if limits[status] < 0:
+                        raise ValueError(value)
+                except (TypeError, ValueError):
+                    log.warn(
+                        f"Ignoring max_{status} = {value} in the config, which isn't "
+                        f"a number of at least 0. Using {default}."
+                    )
+                    limits[status] = default
+        self.limits = limits
+        # Tags that the images built with this scheduler pull. A Dockerfile built
+        # FROM one of them waits for that pull rather than pulling it separately.
+        self.pulls = set(pulls)
+        # The images that each image, by name_complete, is built on, and so waits
+        # for before it starts.
+        self.dependencies = dict(dependencies or {})
+        self._semaphores = {}
+        self._steps = {}
+
+    async def run(self, status, key, fxn, entry, callback=lambda: None):
+        """
+        Run `fxn()` for the given phase once per `key`, queueing behind the phase's
+        limit. Records on `entry` when the step started running.
+        """
+        step = self._steps.get((status, key))
+        if step is None:
+            step = self._steps[status, key] = _Step()
+            step.fut = asyncio.ensure_future(self._run(status, fxn, step))
+        if step.start is None:
+            step.waiters.append((entry, callback))
+        else:
+            entry.start = max(step.start, entry.queued)
+        # Shield the shared step so cancelling one image doesn't cancel it for the
+        # others waiting on it.
+        return await asyncio.shield(step.fut)
+
+    async def _run(self, status, fxn, step):
+        # Create semaphores lazily so they belong to the running event loop. A
+        # limit of 0 means unlimited.
+        if status not in self._semaphores:
+            limit = self.limits.get(status)
+            self._semaphores[status] = asyncio.Semaphore(limit) if limit else None
+        sem = self._semaphores[status]
+        if sem is None:
+            return await self._start(fxn, step)
+        async with sem:
+            return await self._start(fxn, step)
+
+    @staticmethod
+    async def _start(fxn, step):
+        step.start = time.time()
+        for entry, callback in step.waiters:
+            entry.start = step.start
+            callback()
+        step.waiters = []
+        return await fxn()
+
+
+_default_schedulers = weakref.WeakKeyDictionary()
+
+
+def _default_scheduler():
+    """
+    Return the BuildScheduler for images made without one, so that they still share
+    the phase limits and each step runs once. There is one per event loop, since
+    its semaphores and steps belong to the loop they were created on.
+    """
+    loop = asyncio.get_event_loop()
+    try:
+        return _default_schedulers[loop]
+    except KeyError:
+        scheduler = _default_schedulers[loop] = BuildScheduler()
+        return scheduler
+
+
+class _Step:
+    __slots__ = ("fut", "start", "waiters")
+
+    def __init__(self):
+        self.fut = None
+        self.start = None
+        self.waiters = []
+
+
 class HistoryEntry:
     _UNSET = object()
 
     def __init__(self, status, start=_UNSET, finish=False):
+        # `queued` is when the entry was created. For phases that wait on the
+        # BuildScheduler, `start` is None until the step begins running.
         self.status = status
-        self.start = time.time() if start is self._UNSET else start
+        self.queued = time.time()
+        self.start = self.queued if start is self._UNSET else start
         self.end = None
         self.stdout = None
         self.stderr = None
@@ -636,11 +1161,26 @@ class HistoryEntry:
             else:
                 self.finish(stderr=traceback.format_exc())
 
+    @property
+    def queue_time(self):
+        if self.start is None:
+            return None
+        return self.start - self.queued
+
+    @property
+    def run_time(self):
+        if self.start is None or self.end is None:
+            return None
+        return self.end - self.start
+
     def to_dict(self):
         return {
             "status": self.status,
+            "queued": self.queued,
             "start": self.start,
             "end": self.end,
+            "queue_time": self.queue_time,
+            "run_time": self.run_time,
             "stdout": self.stdout,
             "stderr": self.stderr,
         }
@@ -1,13 +1,12 @@
 import asyncio
+import contextlib
 import functools
 import json
-import packaging.version
-import pipes
 import re
-import subprocess
 import os
+import time
 
-from conducto.shared import async_utils
+from conducto.shared import async_utils, constants, file_utils
 from .. import api
 from .._version import __version__
 
@@ -59,6 +58,10 @@ async def text_for_build_dockerfile(
             )
 
         non_conducto_reqs_py = [r for r in reqs_py if r != "conducto"]
+        if unpinned_reqs(non_conducto_reqs_py):
+            # Install the latest versions, rather than reusing an older layer.
+            lines.append("ARG CONDUCTO_REQS_BUSTER")
+            lines.append("RUN echo $CONDUCTO_REQS_BUSTER")
         if non_conducto_reqs_py:
             lines.append(
                 f"RUN {py_binary} -m pip install " + " ".join(non_conducto_reqs_py)
@@ -94,6 +97,22 @@ async def text_for_build_dockerfile(
     return "\n".join(lines)
 
 
+def unpinned_reqs(reqs_py):
+    """
+    Return the entries of `reqs_py` that aren't pinned to one version with "==",
+    so that installing them again may install something else. "conducto" is always
+    installed at this version.
+    """
+    return [
+        r
+        for r in reqs_py or []
+        if r != "conducto"
+        and not re.fullmatch(
+            r"[A-Za-z0-9._-]+(\[[A-Za-z0-9._,-]+\])?===?[^,;<>~!=\s]+", r
+        )
+    ]
+
+
 async def text_for_extend_dockerfile(user_image):
     lines = [f"FROM {user_image}"]
 
@@ -106,24 +125,11 @@ async def text_for_extend_dockerfile(user_image):
 
     default_python = None
     if pyvers is not None:
-        if _is_fedora(linux_flavor) or _is_centos(linux_flavor):
-            # The base Fedora and CentOS images don't have 'which' for some reason. A
-            # workaround is to use python to print sys.executable.
-            which_python, _ = await async_utils.run_and_check(
-                "docker",
-                "run",
-                "--rm",
-                user_image,
-                acceptable_binary,
-                "-c",
-                "import sys; print(sys.executable)",
-            )
-            default_python = which_python.decode("utf8").strip()
-        else:
-            which_python, _ = await async_utils.run_and_check(
-                "docker", "run", "--rm", user_image, "which", acceptable_binary
-            )
-            default_python = which_python.decode("utf8").strip()
+        default_python = await _get_python_path(
+            user_image,
+            acceptable_binary,
+            bool(_is_fedora(linux_flavor) or _is_centos(linux_flavor)),
+        )
 
     uid = await _get_uid(user_image)
     lines.append("USER 0")
@@ -207,150 +213,246 @@ def pull_conducto_worker(worker_image):
     )
 
 
-# Note: we don't need caching here except on get_python_version
-# because we already have caching mechanisms above
-# each image gets their .build called once, and everything below _get_python_version
-# is called just once per name_complete
-
+class _ProbeCache:
+    """
+    Results of probing docker images, persisted under ~/.conducto so that repeat
+    launches with unchanged images don't need to start any containers. Entries are
+    stored one file per image and keyed by the image ID from `docker inspect`, so
+    rebuilding or re-pulling a tag invalidates them. Entries expire after `ttl`
+    seconds, and the least recently used ones are removed once the cache exceeds
+    `max_bytes`.
+    """
 
-@async_utils.async_cache
-async def get_python_version(user_image):
-    pyresults = [None, None]
-
-    for binary in [
-        "python",
-        "python3",
-        "python3.5",
-        "python3.6",
-        "python3.7",
-        "python3.8",
-    ]:
+    _MISSING = object()
+
+    def __init__(self, dirname, ttl, max_bytes):
+        self.dirname = dirname
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+    @classmethod
+    def from_config(cls):
+        config = api.Config()
+        return cls(
+            os.path.join(
+                constants.ConductoPaths.get_local_base_dir(), "image_probe_cache"
+            ),
+            ttl=float(config.get("config", "image_probe_cache_ttl", 7 * 24 * 3600)),
+            max_bytes=int(config.get("config", "image_probe_cache_max_bytes", 2 ** 20)),
+        )
+
+    def _path(self, image_id):
+        return os.path.join(self.dirname, image_id.replace(":", "_") + ".json")
+
+    def _read(self, image_id):
+        path = self._path(image_id)
         try:
-            version = await _get_python_version(user_image, binary)
-            pyresults = [binary, version.release[0:2]]
-            break
-        except (
-            subprocess.CalledProcessError,
-            LowPException,
-            packaging.version.InvalidVersion,
-        ):
-            pass
-
-    pipresults = None
-    # if no python, there is no point in looking for pip
-    if pyresults[0]:
-        for binary in ["pip", "pip3"]:
-            try:
-                version = await _get_pip_version(user_image, binary)
-                pipresults = binary
-                break
-            except subprocess.CalledProcessError:
-                pass
-
-    return pyresults[0], pyresults[1], pipresults
-
-
-async def _get_python_version(user_image, python_binary) -> packaging.version.Version:
-    """Gets python version within a Docker image.
-    Args:
-        user_image: image name
-        python_binary: Python binary (e.g. python3)
-    Returns:
-        packaging.version.Version object
-    Raises:
-        supprocess.CalledProcessError if binary doesn't exist
-        LowPException if version is too low
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry.get("created", 0) + self.ttl < time.time():
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            return None
+        return entry
+
+    def get(self, image_id, key):
+        entry = self._read(image_id)
+        if entry is None or key not in entry["results"]:
+            return self._MISSING
+        # Touch the file so eviction removes the least recently used entries.
+        with contextlib.suppress(OSError):
+            os.utime(self._path(image_id))
+        return entry["results"][key]
+
+    def put(self, image_id, key, value):
+        entry = self._read(image_id) or {"created": time.time(), "results": {}}
+        entry["results"][key] = value
+        with contextlib.suppress(OSError):
+            with file_utils.atomic_write(self._path(image_id), "w") as f:
+                json.dump(entry, f)
+            file_utils.evict_lru(self.dirname, self.max_bytes)
+
+
+_probe_cache = None
+
+
+def _persistent_cache(fxn):
+    """
+    Cache the result of `fxn(image, *args)` on disk by the ID of `image`, in
+    addition to caching it in-process. The result must be JSON-serializable.
     """
 
-    proc = await asyncio.create_subprocess_exec(
-        "docker",
-        "run",
-        "--rm",
-        user_image,
-        python_binary,
-        "--version",
-        stdout=subprocess.PIPE,
-        stderr=subprocess.DEVNULL,
+    @functools.wraps(fxn)
+    async def wrapper(image, *args):
+        global _probe_cache
+        if _probe_cache is None:
+            _probe_cache = _ProbeCache.from_config()
+
+        key = json.dumps([fxn.__name__, *args])
+        image_id = await _get_image_id(image)
+        if image_id is not None:
+            result = _probe_cache.get(image_id, key)
+            if result is not _ProbeCache._MISSING:
+                return result
+
+        # Round-trip through JSON so results look the same whether or not they
+        # came from the cache.
+        result = json.loads(json.dumps(await fxn(image, *args)))
+        if image_id is not None:
+            _probe_cache.put(image_id, key, result)
+        return result
+
+    return async_utils.async_cache(wrapper)
+
+
+@async_utils.async_cache
+async def _inspect(image_name):
+    """
+    Return the `docker inspect` output for the image, or None if it isn't
+    available locally.
+    """
+    out, _err = await async_utils.run_and_check(
+        "docker", "inspect", "--format", "{{json .}}", image_name, stop_on_error=False
     )
-    out, err = await proc.communicate()
-    out = out.decode("utf-8")
-
-    python_version = re.sub(r"^Python\s+", r"", out, re.IGNORECASE,).strip()
-    python_version = packaging.version.Version(python_version)
-    if python_version < packaging.version.Version("3.5"):
-        raise LowPException("")
-    return python_version
-
-
-async def _get_pip_version(user_image, pip_binary) -> packaging.version.Version:
-    """Gets pip version within a Docker image.
-    Args:
-        user_image: image name
-        pip_binary: Python binary (e.g. pip3)
-    Returns:
-        packaging.version.Version object
-    Raises:
-        supprocess.CalledProcessError if binary doesn't exist
+    if not out.strip():
+        return None
+    return json.loads(out)
+
+
+async def _get_image_id(image_name):
+    d = await _inspect(image_name)
+    return d["Id"] if d else None
+
+
+# Shell script run in a single container to gather everything we need to know about
+# an image. It sticks to POSIX sh and head, because many images don't have 'which'
+# (e.g., Fedora and CentOS) or python at all. Each line it prints is
+# tab-separated and tagged with what it describes.
+_PROBE_SCRIPT = r"""
+for f in /etc/*-release; do
+    [ -f "$f" ] && while IFS= read -r line; do printf 'release\t%s\n' "$line"; done < "$f"
+done
+for b in python python3 python3.5 python3.6 python3.7 python3.8; do
+    p=$(command -v "$b" 2>/dev/null) || continue
+    v=$("$b" --version 2>&1 | head -n 1)
+    e=$("$b" -c 'import sys; print(sys.executable)' 2>/dev/null)
+    printf 'python\t%s\t%s\t%s\t%s\n' "$b" "$p" "$e" "$v"
+done
+for b in pip pip3; do
+    v=$("$b" --version 2>/dev/null) && printf 'pip\t%s\t%s\n' "$b" "$v"
+done
+exit 0
+"""
+
+
+@_persistent_cache
+async def _probe_image(user_image):
     """
-
-    words = [
-        "docker",
-        "run",
-        "--rm",
-        user_image,
-        pip_binary,
-        "--version",
-    ]
-    proc = await asyncio.create_subprocess_exec(
-        *words, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    Start one container from the image to find its OS and python/pip installs.
+    Returns a dict like:
+        {
+            "os": {"flavor": "debian", "version": "10", "pretty_name": "..."},
+            "pythons": [
+                {"binary": "python3", "path": "/usr/bin/python3",
+                 "executable": "/usr/bin/python3", "version": "3.7.3"},
+                ...
+            ],
+            "pips": [{"binary": "pip3", "version": "18.1"}, ...],
+        }
+    """
+    out, _err = await async_utils.run_and_check(
+        "docker", "run", "--rm", "--entrypoint", "sh", user_image, "-c", _PROBE_SCRIPT,
     )
-    out, err = await proc.communicate()
-    out = out.decode("utf-8")
+    return _parse_probe(out.decode("utf-8"))
+
+
+def _parse_probe(out):
+    result = {
+        "os": {"flavor": None, "version": None, "pretty_name": None},
+        "pythons": [],
+        "pips": [],
+    }
+    for line in out.splitlines():
+        kind, _, rest = line.partition("\t")
+        fields = rest.split("\t")
+        if kind == "release":
+            # Only the ID=, VERSION_ID= and PRETTY_NAME= lines matter.
+            key, _, value = rest.strip().partition("=")
+            value = value.strip().strip('"')
+            if key == "ID":
+                result["os"]["flavor"] = value
+            elif key == "VERSION_ID":
+                result["os"]["version"] = value
+            elif key == "PRETTY_NAME":
+                result["os"]["pretty_name"] = value
+        elif kind == "python" and len(fields) == 4:
+            binary, path, executable, version = fields
+            version = re.sub(r"^Python\s+", r"", version, flags=re.IGNORECASE).strip()
+            result["pythons"].append(
+                {
+                    "binary": binary,
+                    "path": path,
+                    "executable": executable or None,
+                    "version": version,
+                }
+            )
+        elif kind == "pip" and len(fields) == 2:
+            binary, version = fields
+            m = re.search(r"^pip ([0-9.]+)", version)
+            if m:
+                result["pips"].append({"binary": binary, "version": m.group(1)})
+    return result
+
 
-    if proc.returncode != 0:
-        cmdstr = " ".join(pipes.quote(a) for a in words)
-        raise subprocess.CalledProcessError(proc.returncode, cmdstr, out, err)
+def _acceptable_python(probe):
+    import packaging.version
 
-    # we don't really care about the pip version, but I retain it here for
-    # similarity with the python version of this function.
-    pip_version = re.search(r"^pip ([0-9.]+)", out)
-    pip_version = packaging.version.Version(pip_version.group(1))
-    return pip_version
+    for python in probe["pythons"]:
+        try:
+            version = packaging.version.Version(python["version"])
+        except packaging.version.InvalidVersion:
+            continue
+        if version >= packaging.version.Version("3.5"):
+            return python, version
+    return None, None
 
 
-async def _get_linux_flavor_and_version(user_image):
-    subp = await asyncio.create_subprocess_shell(
-        f'docker run --rm {user_image} sh -c "cat /etc/*-release"',
-        shell=True,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.DEVNULL,
-    )
-    out, err = await subp.communicate()
-    out = out.decode("utf-8").strip()
+async def get_python_version(user_image):
+    probe = await _probe_image(user_image)
+    python, version = _acceptable_python(probe)
+    if python is None:
+        return None, None, None
+
+    # if no python, there is no point in looking for pip
+    pip_binary = probe["pips"][0]["binary"] if probe["pips"] else None
+    return python["binary"], version.release[0:2], pip_binary
+
 
-    flavor = None
-    version = None
-    pretty_name = None
+async def _get_python_path(user_image, python_binary, use_sys_executable):
+    probe = await _probe_image(user_image)
+    for python in probe["pythons"]:
+        if python["binary"] == python_binary:
+            if use_sys_executable:
+                return python["executable"]
+            return python["path"]
+    return None
 
-    # Now we filter out only lines that start with ID= & VERSION_ID= for flavor
-    # and version respectively.
-    outlines = [line.strip() for line in out.split("\n")]
-    for line in outlines:
-        if line.startswith("ID="):
-            flavor = line[len("ID=") :].strip().strip('"')
-        if line.startswith("VERSION_ID="):
-            version = line[len("VERSION_ID=") :].strip().strip('"')
-        if line.startswith("PRETTY_NAME="):
-            pretty_name = line[len("PRETTY_NAME=") :].strip().strip('"')
 
-    return flavor, version, pretty_name
+async def _get_linux_flavor_and_version(user_image):
+    probe = await _probe_image(user_image)
+    os_info = probe["os"]
+    return os_info["flavor"], os_info["version"], os_info["pretty_name"]
 
 
 async def _get_uid(image_name):
-    out, _err = await async_utils.run_and_check(
-        "docker", "inspect", "--format", "{{json .}}", image_name
-    )
-    d = json.loads(out)
+    d = await _inspect(image_name)
+    if d is None:
+        out, _err = await async_utils.run_and_check(
+            "docker", "inspect", "--format", "{{json .}}", image_name
+        )
+        d = json.loads(out)
     uid_str = d["Config"]["User"]
     if uid_str == "":
         uid = 0
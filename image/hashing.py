@@ -0,0 +1,186 @@
+import contextlib
+import hashlib
+import json
+import os
+import re
+import stat
+import time
+
+from conducto.shared import constants, file_utils
+
+# Files modified this recently may still be changing within the resolution of their
+# mtime, so their digests aren't trusted from the index.
+_RACY_SECS = 2
+
+
+def file_digest(path):
+    """Hex digest of a file's contents."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def tree_digest(dirname, ignore=None):
+    """
+    Hex digest of everything in a directory tree: relative paths, file contents,
+    executable bits and symlink targets. Paths that the DockerIgnore `ignore`
+    excludes are left out.
+
+    Hashing a large tree is made nearly free on repeat calls by an index, persisted
+    under ~/.conducto, of each file's (mtime, size, inode) and digest. Only files
+    whose stat has changed since the last call are read again.
+    """
+    dirname = os.path.realpath(dirname)
+    index = _Index(dirname)
+    h = hashlib.blake2b(digest_size=16)
+    for relpath, st, target in _walk(dirname, ignore):
+        if target is not None:
+            h.update(f"L\0{relpath}\0{target}\0".encode())
+            continue
+        digest = index.lookup(relpath, st)
+        if digest is None:
+            digest = file_digest(os.path.join(dirname, relpath))
+            index.store(relpath, st, digest)
+        executable = "x" if st.st_mode & stat.S_IXUSR else "-"
+        h.update(f"F\0{relpath}\0{executable}\0{digest}\0".encode())
+    index.save()
+    return h.hexdigest()
+
+
+def _walk(dirname, ignore, prefix=""):
+    # Yield (relpath, stat, symlink_target) for every file in sorted order, without
+    # following symlinks.
+    with os.scandir(os.path.join(dirname, prefix)) as it:
+        entries = sorted(it, key=lambda de: de.name)
+    for de in entries:
+        relpath = prefix + de.name
+        if de.is_dir(follow_symlinks=False):
+            if ignore is None or not ignore.prunes(relpath):
+                yield from _walk(dirname, ignore, relpath + "/")
+        elif ignore is not None and ignore.excludes(relpath):
+            continue
+        elif de.is_symlink():
+            yield relpath, None, os.readlink(de.path)
+        elif de.is_file():
+            yield relpath, de.stat(), None
+
+
+class DockerIgnore:
+    """
+    The patterns of a .dockerignore file, which exclude paths from a docker build
+    context. As in docker, the last pattern that matches a path or one of its
+    parent directories decides, and patterns starting with "!" re-include.
+    """
+
+    def __init__(self, lines):
+        self.patterns = []
+        for line in lines:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            include = line.startswith("!")
+            if include:
+                line = line[1:].strip()
+            line = os.path.normpath(line).lstrip("/")
+            if line in ("", "."):
+                continue
+            self.patterns.append((_pattern_to_regex(line), include))
+        self.has_includes = any(include for _, include in self.patterns)
+
+    @classmethod
+    def from_dir(cls, dirname):
+        """Return the DockerIgnore for `dirname`, or None if it has none."""
+        try:
+            with open(os.path.join(dirname, ".dockerignore")) as f:
+                return cls(f.read().splitlines())
+        except FileNotFoundError:
+            return None
+
+    def excludes(self, relpath):
+        parts = relpath.split("/")
+        prefixes = ["/".join(parts[: i + 1]) for i in range(len(parts))]
+        excluded = False
+        for regex, include in self.patterns:
+            if any(regex.match(prefix) for prefix in prefixes):
+                excluded = not include
+        return excluded
+
+    def prunes(self, relpath):
+        # An excluded directory can be skipped entirely, unless some "!" pattern
+        # might re-include something inside it.
+        return not self.has_includes and self.excludes(relpath)
+
+
+def _pattern_to_regex(pattern):
+    # Translate a .dockerignore pattern, in the syntax of Go's filepath.Match plus
+    # "**" for any number of directories, into a regex.
+    out = []
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith("**", i):
+            i += 2
+            if pattern.startswith("/", i):
+                i += 1
+                out.append("(?:.*/)?")
+            else:
+                out.append(".*")
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            end = pattern.find("]", i + 1)
+            if end == -1:
+                out.append(re.escape(c))
+            else:
+                body = pattern[i + 1 : end]
+                if body[:1] in ("^", "!"):
+                    body = "^" + body[1:]
+                out.append(f"[{body}]")
+                i = end
+        elif c == "\\" and i + 1 < len(pattern):
+            i += 1
+            out.append(re.escape(pattern[i]))
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return re.compile("".join(out) + "$")
+
+
+class _Index:
+    def __init__(self, dirname):
+        key = hashlib.md5(dirname.encode()).hexdigest()
+        self.path = os.path.join(
+            constants.ConductoPaths.get_local_base_dir(), "hash_index", key + ".json"
+        )
+        self.now = time.time()
+        try:
+            with open(self.path) as f:
+                self.old = json.load(f)
+        except (OSError, ValueError):
+            self.old = {}
+        self.new = {}
+
+    def lookup(self, relpath, st):
+        entry = self.old.get(relpath)
+        if entry is not None and entry[:3] == [st.st_mtime_ns, st.st_size, st.st_ino]:
+            self.new[relpath] = entry
+            return entry[3]
+        return None
+
+    def store(self, relpath, st, digest):
+        if st.st_mtime > self.now - _RACY_SECS:
+            return
+        self.new[relpath] = [st.st_mtime_ns, st.st_size, st.st_ino, digest]
+
+    def save(self):
+        # Rewriting the index also drops entries for files that were deleted.
+        if self.new == self.old:
+            return
+        with contextlib.suppress(OSError):
+            with file_utils.atomic_write(self.path, "w") as f:
+                json.dump(self.new, f)
@@ -6,6 +6,7 @@ import pipes
 import shutil
 import socket
 import sys
+import tempfile
 from http import HTTPStatus as hs
 
 from conducto import api
@@ -74,10 +75,12 @@ def _wsl_translate_locations(node):
 
     image_ids = []
     imagelist = []
-    for child in node.stream():
-        if id(child.image) not in image_ids:
-            image_ids.append(id(child.image))
-            imagelist.append(child.image)
+    with node._bulk_inherited_attributes():
+        for child in node.stream():
+            img = child.image
+            if id(img) not in image_ids:
+                image_ids.append(id(img))
+                imagelist.append(img)
 
     for img in imagelist:
         path = img.copy_dir
@@ -104,10 +107,12 @@ def _windows_translate_locations(node):
 
     image_ids = []
     imagelist = []
-    for child in node.stream():
-        if id(child.image) not in image_ids:
-            image_ids.append(id(child.image))
-            imagelist.append(child.image)
+    with node._bulk_inherited_attributes():
+        for child in node.stream():
+            img = child.image
+            if id(img) not in image_ids:
+                image_ids.append(id(img))
+                imagelist.append(img)
 
     for img in imagelist:
         path = img.copy_dir
@@ -157,25 +162,34 @@ def build(
     # Force in case of cognito change
     node.token = token = api.Auth().get_token_from_shell(force=True)
 
-    serialization = node.serialize()
-
-    command = " ".join(pipes.quote(a) for a in sys.argv)
-
-    # Register pipeline, get <pipeline_id>
-    cloud = build_mode == constants.BuildMode.DEPLOY_TO_CLOUD
-    pipeline_id = api.Pipeline().create(
-        token,
-        command,
-        cloud=cloud,
-        retention=retention,
-        tags=node.tags or [],
-        title=node.title,
-        is_public=is_public,
+    # The columnar format is much smaller for large pipelines, but the manager
+    # reading it must understand it, so it is opt-in.
+    serialization_format = os.getenv("CONDUCTO_SERIALIZATION_FORMAT") or (
+        api.Config().get("config", "serialization_format", "json")
     )
+    # Stream the serialization to a file rather than holding it in memory, since it
+    # can be large for big pipelines.
+    with tempfile.TemporaryFile() as serialization:
+        node.serialize_to(serialization, format=serialization_format, binary=True)
+        serialization.seek(0)
+
+        command = " ".join(pipes.quote(a) for a in sys.argv)
+
+        # Register pipeline, get <pipeline_id>
+        cloud = build_mode == constants.BuildMode.DEPLOY_TO_CLOUD
+        pipeline_id = api.Pipeline().create(
+            token,
+            command,
+            cloud=cloud,
+            retention=retention,
+            tags=node.tags or [],
+            title=node.title,
+            is_public=is_public,
+        )
 
-    launch_from_serialization(
-        serialization, pipeline_id, build_mode, use_shell, use_app, token
-    )
+        launch_from_serialization(
+            serialization, pipeline_id, build_mode, use_shell, use_app, token
+        )
 
 
 def launch_from_serialization(
@@ -188,6 +202,11 @@ def launch_from_serialization(
     inject_env=None,
     is_migration=False,
 ):
+    """
+    Launch the pipeline from `serialization`, either a string or a binary file
+    object positioned at its start, which is copied from without reading it all
+    into memory.
+    """
     if not token:
         token = api.Auth().get_token_from_shell(force=True)
 
@@ -210,8 +229,12 @@ def launch_from_serialization(
             local_progdir, constants.ConductoPaths.SERIALIZATION
         )
 
-        with open(serialization_path, "w") as f:
-            f.write(serialization)
+        if isinstance(serialization, str):
+            with open(serialization_path, "w") as f:
+                f.write(serialization)
+        else:
+            with open(serialization_path, "wb") as f:
+                shutil.copyfileobj(serialization, f)
 
         api.Pipeline().update(token, pipeline_id, {"program_path": serialization_path})
 
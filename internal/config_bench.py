@@ -0,0 +1,112 @@
+"""
+Benchmark for the config overhead of launching a pipeline.
+
+    python -m conducto.internal.config_bench [--calls N] [--min-speedup X]
+
+Writes a config file with a few profiles to a temporary directory, then times
+constructing N Configs (20 by default, about what a launch does) and reading the
+profile's URL and token from each, against the reference: the original
+Config.reload, which parsed the file again for every Config. It fails if the
+values differ, or if the shared Config isn't at least X times faster (10 by
+default).
+"""
+
+import argparse
+import configparser
+import gc
+import os
+import sys
+import tempfile
+import time
+
+from conducto import api
+
+
+def make_config(path, num_profiles=4):
+    """Write a config file like `conducto login` makes for `num_profiles` orgs."""
+    parser = configparser.ConfigParser()
+    parser["general"] = {"default": "profile0", "show_app": "true"}
+    for i in range(num_profiles):
+        parser[f"profile{i}"] = {
+            "url": "https://www.conducto.com",
+            "org_id": str(1000 + i),
+            "email": f"user{i}@example.com",
+            "token": "t" * 600,
+        }
+    parser["config"] = {"data_read_cache": "false", "image_probe_cache_ttl": "3600"}
+    with open(path, "w") as f:
+        parser.write(f)
+
+
+def _original_config(path):
+    # Config.__init__ and Config.get as they were before the parsed file was shared.
+    config = configparser.ConfigParser()
+    config.read(path)
+    profile = config.get("general", "default", fallback=None)
+    return config.get(profile, "url", fallback=None), config.get(profile, "token")
+
+
+def _shared_config(path):
+    config = api.Config()
+    return config.get_url(), config.get_token()
+
+
+def reference_calls(path, calls):
+    return [_original_config(path) for _ in range(calls)]
+
+
+def shared_calls(path, calls):
+    return [_shared_config(path) for _ in range(calls)]
+
+
+def _best_times(fxns, args, repeat):
+    """
+    Return the fastest time of each of `fxns` called on `args`. Their runs are
+    interleaved, so that both see the same load from everything else that is
+    running on this machine.
+    """
+    best = [None] * len(fxns)
+    for _ in range(repeat):
+        for i, fxn in enumerate(fxns):
+            gc.collect()
+            start = time.perf_counter()
+            fxn(*args)
+            elapsed = time.perf_counter() - start
+            best[i] = elapsed if best[i] is None else min(best[i], elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--min-speedup", type=float, default=10)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "config")
+        make_config(path)
+        os.environ["CONDUCTO_CONFIG"] = path
+        os.environ.pop("CONDUCTO_PROFILE", None)
+        os.environ.pop("CONDUCTO_URL", None)
+
+        failed = False
+        if shared_calls(path, 1) != reference_calls(path, 1):
+            print("FAIL: the shared Config reads different values")
+            failed = True
+
+        shared, reference = _best_times(
+            [shared_calls, reference_calls], (path, args.calls), args.repeat
+        )
+    print(
+        f"{args.calls} Configs: {shared * 1e3:.3f}ms vs {reference * 1e3:.3f}ms "
+        f"for the reference, {reference / shared:.1f}x"
+    )
+    if reference / shared < args.min_speedup:
+        print(f"FAIL: the shared Config is less than {args.min_speedup:g}x faster")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+"""
+Benchmark for loading serialized pipelines.
+
+    python -m conducto.internal.deserialize_bench [--nodes N] [--min-speedup X]
+
+Serializes a generated tree of N nodes (200k by default), then times
+Node.deserialize against the reference loader: the original Node.deserialize,
+which built the same tree one node at a time through Node.__init__ and
+Node.__setitem__, as they were before the bulk loader. Both are timed end to end,
+from the serialized string, and on building the tree from the decoded JSON alone,
+since decoding is the same for both. It fails if the loaded tree doesn't
+re-serialize to the same JSON, or if Node.deserialize isn't at least X times
+faster end to end (2.5 by default, against 3.5 to 4 measured here).
+"""
+
+import argparse
+import base64
+import gc
+import gzip
+import json
+import sys
+import itertools
+import time
+
+import conducto as co
+from conducto import callback, image as image_mod, pipeline
+from conducto.shared import constants
+
+
+def make_tree(num_nodes):
+    """
+    Return a tree of about `num_nodes` nodes shaped like a generated pipeline:
+    Serial stages of Parallel groups of Exec nodes, with a few images, env
+    variables and callbacks.
+    """
+    root = co.Serial(image=co.Image("python:3.8-slim", name="base"))
+    root.on_error(callback.retry(3))
+    stage_i = 0
+    count = 1
+    while count < num_nodes:
+        stage = root[f"stage{stage_i}"] = co.Serial(env={"STAGE": str(stage_i)})
+        count += 1
+        for group_i in range(10):
+            group = stage[f"group{group_i}"] = co.Parallel(cpu=2)
+            count += 1
+            if group_i == 0:
+                group.image = co.Image(
+                    "python:3.8-slim", name=f"img{stage_i}", reqs_py=["conducto"]
+                )
+            for exec_i in range(98):
+                group[f"exec{exec_i}"] = co.Exec(
+                    f"python run.py --stage {stage_i} --item {exec_i}",
+                    mem=1.5 if exec_i % 4 == 0 else None,
+                )
+                count += 1
+        stage_i += 1
+    return root
+
+
+_CLASSES = {
+    "Exec": pipeline.Exec,
+    "Serial": pipeline.Serial,
+    "Parallel": pipeline.Parallel,
+}
+
+
+def _json_text(string):
+    return gzip.decompress(base64.b64decode(string))
+
+
+def _decode(string):
+    return json.loads(_json_text(string))
+
+
+# The per-node loading path from before the bulk loader, copied here so that the
+# reference doesn't change along with Node. The original load_node() passed every
+# key of a row to the constructor, which rejected the describe-only ones, so those
+# are dropped and env is folded back, like load_node() does now.
+
+
+def _original_root(node):
+    # Node.root, with path compression.
+    if node._root != node:
+        node._root = _original_root(node._root)
+    return node._root
+
+
+def _original_init(
+    self,
+    *,
+    env=None,
+    skip=False,
+    cpu=None,
+    gpu=None,
+    mem=None,
+    requires_docker=None,
+    suppress_errors=False,
+    same_container=constants.SameContainer.INHERIT,
+    image=None,
+    image_name=None,
+    doc=None,
+    title=None,
+    tags=None,
+    file=None,
+    line=None,
+):
+    # Node.__init__, for a Node created with its file and line and without a name.
+    self.id_generator, self.id_root = itertools.count(), self
+    self.id = None
+
+    self.parent = None
+    self._root = self
+    self.children = {}
+    self._callbacks = []
+    self.token = None
+
+    assert image_name is None or image is None, "can only specify one image"
+
+    self._repo = image_mod.Repository()
+    self.user_set = {
+        "skip": skip,
+        "cpu": cpu,
+        "gpu": gpu,
+        "mem": mem,
+        "requires_docker": requires_docker,
+    }
+    self.user_set["image_name"] = image_name
+
+    self.env = env or {}
+
+    self.doc = doc
+    self.title = title
+    self.tags = pipeline.Node.sanitize_tags(tags)
+    self._name = "/"
+
+    self.suppress_errors = suppress_errors
+    self.same_container = same_container
+
+    self._autorun = None
+    self._sleep_when_done = None
+
+    self._file = file
+    self.line = line
+
+
+def _original_exec_init(self, command, *args, **kwargs):
+    # Exec.__init__, for a command string.
+    if callable(command):
+        raise NotImplementedError
+    if args:
+        raise ValueError(f"Only allowed arg is command. Got: {args}")
+    _original_init(self, **kwargs)
+    self.command = command
+
+
+def _original_load_node(**kwargs):
+    node_type = kwargs.pop("type")
+    kwargs.pop("id", None)
+    kwargs.pop("callbacks", None)
+    stop_on_error = kwargs.pop("stop_on_error", True)
+    env = {
+        key[len("__env__") :]: kwargs.pop(key)
+        for key in list(kwargs)
+        if key.startswith("__env__")
+    }
+    if env:
+        kwargs["env"] = env
+    cls = _CLASSES[node_type]
+    node = cls.__new__(cls)
+    if cls is pipeline.Exec:
+        _original_exec_init(node, **kwargs)
+    else:
+        _original_init(node, **kwargs)
+        if cls is pipeline.Serial:
+            node.stop_on_error = stop_on_error
+    return node
+
+
+def _original_setitem(self, name, node):
+    # Node.__setitem__, for a name without "/".
+    if (
+        name in self.children
+        or _original_root(node) == _original_root(self)
+        or _original_root(node) != node
+    ):
+        raise pipeline.TreeError(
+            f"Adding node {name} violates the integrity of the pipeline"
+        )
+    self.children[name] = node
+
+    _original_root(self)._repo.merge(_original_root(node)._repo)
+
+    node.parent = self
+    node._root = _original_root(self)
+    node._name = name
+
+
+def reference_build(data):
+    """
+    Build the tree from decoded JSON the way Node.deserialize did before it
+    bulk-loaded: the original load_node() for every node, then the original
+    Node.__setitem__ for every edge.
+    """
+    nodes = {i["id"]: _original_load_node(**i) for i in data["nodes"]}
+    for i in data["nodes"]:
+        for event, (cb_name, cb_args) in i.get("callbacks", []):
+            kwargs = {k: nodes[cb_args[k]] for k in cb_args.get("__node_args__", [])}
+            nodes[i["id"]]._callbacks.append((event, callback.base(cb_name, **kwargs)))
+    for parent, child, name in data["edges"]:
+        _original_setitem(nodes[parent], name, nodes[child])
+    root = nodes[data["nodes"][0]["id"]]
+    root.token = data.get("token")
+    root._autorun = data.get("autorun", False)
+    root._sleep_when_done = data.get("sleep_when_done", False)
+    return root
+
+
+def bulk_build(data):
+    """Build the tree from decoded JSON the way Node.deserialize does."""
+    with pipeline._gc_paused():
+        return pipeline._bulk_load(data)
+
+
+def reference_load(string):
+    return reference_build(_decode(string))
+
+
+def _best_times(fxns, arg, repeat):
+    """
+    Return the fastest time of each of `fxns` called on `arg`. Their runs are
+    interleaved, so that both see the same load from everything else that is
+    running on this machine.
+    """
+    best = [None] * len(fxns)
+    for _ in range(repeat):
+        for i, fxn in enumerate(fxns):
+            start = time.perf_counter()
+            result = fxn(arg)
+            elapsed = time.perf_counter() - start
+            best[i] = elapsed if best[i] is None else min(best[i], elapsed)
+            # Free the tree outside of the timed part, so that no run pays for the
+            # one before it.
+            del result
+            gc.collect()
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--nodes", type=int, default=200_000)
+    parser.add_argument("--min-speedup", type=float, default=2.5)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    root = make_tree(args.nodes)
+    string = root.serialize()
+    num_nodes = sum(1 for _ in root.stream())
+    del root
+
+    failed = False
+    loaded = pipeline.Node.deserialize(string)
+    # Compare the JSON text, since the gzip header has a timestamp. Decoded JSON
+    # would hide values that changed type, like 1.0 loading as 1.
+    if _json_text(loaded.serialize()) != _json_text(string):
+        print("FAIL: the loaded tree re-serializes differently")
+        failed = True
+    del loaded
+
+    data = _decode(string)
+    results = [
+        (
+            "building the tree",
+            *_best_times([bulk_build, reference_build], data, args.repeat),
+        ),
+        (
+            "end to end",
+            *_best_times(
+                [pipeline.Node.deserialize, reference_load], string, args.repeat
+            ),
+        ),
+    ]
+    print(f"{num_nodes} nodes, {len(string) / 1e6:.1f}MB serialized")
+    for title, bulk, reference in results:
+        print(
+            f"  {title}: {bulk:.3f}s vs {reference:.3f}s for the reference, "
+            f"{reference / bulk:.1f}x"
+        )
+    bulk, reference = results[1][1:]
+    if reference / bulk < args.min_speedup:
+        print(f"FAIL: deserializing is less than {args.min_speedup:g}x faster")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
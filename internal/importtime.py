@@ -0,0 +1,97 @@
+"""
+Import-time benchmark for conducto, using `python -X importtime`.
+
+    python -m conducto.internal.importtime [--budget-ms MS] [--repeat N] [STMT]
+
+Runs STMT (by default, what a worker process needs: `import conducto` plus the
+pipeline and glue) in fresh interpreters and reports the best total import time,
+with the slowest modules. It fails if any of the heavy dependencies that should
+only load on first use were imported, or if the time exceeds the budget. The
+default budget, 250ms, leaves room above the 100-170ms measured on development
+machines, so that only a real regression trips it.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+DEFAULT_STMT = "import conducto as co; co.Exec; co.main"
+
+# Slow to import and not needed just to define or run a node.
+DEFERRED_MODULES = [
+    "boto3",
+    "botocore",
+    "jose",
+    "dateutil",
+    "packaging",
+    "websockets",
+    "conducto.image.names",
+]
+
+_MARKER = "__conducto_importtime_start__"
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure(stmt=DEFAULT_STMT):
+    """
+    Return `(total_us, modules)` for running `stmt` in a new interpreter, where
+    `modules` is a list of `(cumulative_us, depth, name)` for everything it
+    imported, in import order.
+    """
+    code = f"import sys; print({_MARKER!r}, file=sys.stderr, flush=True); {stmt}"
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        env=env,
+        universal_newlines=True,
+        check=True,
+    )
+    # Ignore what the interpreter imported on startup, before the marker.
+    lines = proc.stderr.split(_MARKER, 1)[-1].splitlines()
+    modules = []
+    for line in lines:
+        m = _LINE_RE.match(line)
+        if m:
+            depth = (len(m.group(3)) - 1) // 2
+            modules.append((int(m.group(2)), depth, m.group(4)))
+    total = sum(cumulative for cumulative, depth, _ in modules if depth == 0)
+    return total, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("stmt", nargs="?", default=DEFAULT_STMT)
+    parser.add_argument("--budget-ms", type=float, default=250)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    # Take the fastest run, which is the least disturbed by everything else that is
+    # running on this machine.
+    total, modules = min(measure(args.stmt) for _ in range(args.repeat))
+    print(f"{args.stmt}: {total / 1000:.1f}ms (budget {args.budget_ms:g}ms)")
+    for cumulative, depth, name in sorted(modules, reverse=True)[: args.top]:
+        print(f"  {cumulative / 1000:8.1f}ms  {'  ' * depth}{name}")
+
+    imported = {name for _, _, name in modules}
+    eager = [
+        mod
+        for mod in DEFERRED_MODULES
+        if any(name == mod or name.startswith(mod + ".") for name in imported)
+    ]
+    failed = False
+    if eager:
+        print(f"FAIL: imported eagerly: {', '.join(eager)}")
+        failed = True
+    if total / 1000 > args.budget_ms:
+        print(f"FAIL: over budget by {total / 1000 - args.budget_ms:.1f}ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
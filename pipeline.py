@@ -1,13 +1,18 @@
 import base64
 import collections
+import contextlib
 import functools
+import gc
 import gzip
 import inspect
+import io
 import itertools
 import json
+import operator
 import os
 import re
-import traceback
+import sys
+import types
 import typing
 
 import conducto.internal.host_detection as hostdet
@@ -21,6 +26,50 @@ class TreeError(Exception):
     pass
 
 
+class DebugInfo:
+    ALWAYS = "always"
+    SAMPLED = "sampled"
+    PER_FILE = "per_file"
+    NEVER = "never"
+    all = [ALWAYS, SAMPLED, PER_FILE, NEVER]
+
+
+def _configured_debug_info_policy():
+    # A bad value shouldn't keep conducto from importing, so warn and use the default.
+    policy = os.getenv("CONDUCTO_DEBUG_INFO") or api.Config().get(
+        "config", "debug_info", DebugInfo.ALWAYS
+    )
+    if policy not in DebugInfo.all:
+        log.warn(
+            f"Unknown debug info policy {repr(policy)}, expected one of "
+            f"{DebugInfo.all}. Using {repr(DebugInfo.ALWAYS)}."
+        )
+        policy = DebugInfo.ALWAYS
+    return policy
+
+
+def _configured_debug_info_sample_rate(default=100):
+    value = os.getenv("CONDUCTO_DEBUG_INFO_SAMPLE_RATE") or api.Config().get(
+        "config", "debug_info_sample_rate", default
+    )
+    try:
+        rate = int(value)
+    except ValueError:
+        rate = 0
+    if rate < 1:
+        log.warn(
+            f"Debug info sample rate must be an integer >= 1, got {repr(value)}. "
+            f"Using {default}."
+        )
+        rate = default
+    return rate
+
+
+class SerializationFormat:
+    JSON = "json"
+    COLUMNAR = "columnar"
+
+
 def jsonable(obj):
     try:
         json.dumps(obj)
@@ -30,14 +79,261 @@ def jsonable(obj):
 
 
 def load_node(**kwargs):
-    if kwargs["type"] == "Exec":
+    # Accepts the output of Node.describe(). Keys that aren't constructor
+    # arguments are dropped and "__env__"-prefixed keys are folded back into env.
+    node_type = kwargs.pop("type")
+    kwargs.pop("id", None)
+    kwargs.pop("callbacks", None)
+    env = {
+        key[len("__env__") :]: kwargs.pop(key)
+        for key in list(kwargs)
+        if key.startswith("__env__")
+    }
+    if env:
+        kwargs["env"] = env
+
+    if node_type == "Exec":
         return Exec(**kwargs)
-    elif kwargs["type"] == "Serial":
+    elif node_type == "Serial":
         return Serial(**kwargs)
-    elif kwargs["type"] == "Parallel":
+    elif node_type == "Parallel":
         return Parallel(**kwargs)
     else:
-        raise TypeError("Type {} not a valid node type".format(kwargs["type"]))
+        raise TypeError("Type {} not a valid node type".format(node_type))
+
+
+# Keys of Node.describe() that are not stored in Node.user_set.
+_DESCRIBE_ONLY_KEYS = {
+    "id",
+    "callbacks",
+    "type",
+    "file",
+    "line",
+    "doc",
+    "title",
+    "tags",
+    "same_container",
+    "suppress_errors",
+    "stop_on_error",
+    "command",
+}
+
+
+@contextlib.contextmanager
+def _gc_paused():
+    # Decoding a large pipeline allocates hundreds of thousands of long-lived
+    # objects, which otherwise triggers repeated collections that free nothing.
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if hasattr(gc, "freeze") and gc.get_freeze_count() == 0:
+            # Move everything allocated meanwhile straight to the oldest generation.
+            # Otherwise the next young collection traverses all of it, only to
+            # promote it there anyway. Skipped if the application has frozen
+            # objects itself, since unfreezing would hand those back to the
+            # collector too.
+            gc.freeze()
+            gc.unfreeze()
+        if was_enabled:
+            gc.enable()
+
+
+_DEFAULT_USER_SET = {
+    "skip": False,
+    "cpu": None,
+    "gpu": None,
+    "mem": None,
+    "requires_docker": None,
+    "image_name": None,
+}
+
+
+class _RowLayout:
+    """
+    How _bulk_load() reads the rows of a serialized pipeline that have the keys
+    `keys`, worked out once for all of them.
+    """
+
+    __slots__ = (
+        "user_set_keys",
+        "get_user_set",
+        "user_sets",
+        "env_keys",
+        "has_extras",
+        "has_file_and_line",
+        "has_callbacks",
+    )
+
+    def __init__(self, keys):
+        self.user_set_keys = [
+            k
+            for k in keys
+            if k not in _DESCRIBE_ONLY_KEYS and not k.startswith("__env__")
+        ]
+        # Nodes mostly repeat a few combinations of user_set values, so the
+        # contents of each one are built once, keyed by user_set_key(row), and
+        # copied into every node that has it.
+        if self.user_set_keys:
+            self.get_user_set = operator.itemgetter(*self.user_set_keys)
+        else:
+            self.get_user_set = lambda row: ()
+        self.user_sets = {}
+        self.env_keys = [
+            (k[len("__env__") :], k) for k in keys if k.startswith("__env__")
+        ]
+        self.has_extras = any(
+            k in keys
+            for k in ("suppress_errors", "same_container", "doc", "title", "tags")
+        )
+        self.has_file_and_line = "file" in keys and "line" in keys
+        self.has_callbacks = "callbacks" in keys
+
+    def user_set_key(self, row):
+        """
+        Return the key of the row's user_set in user_sets. Values are paired with
+        their types, since 1, 1.0 and True are equal as dict keys but serialize
+        differently.
+        """
+        values = self.get_user_set(row)
+        if len(self.user_set_keys) == 1:
+            return type(values), values
+        return tuple(map(type, values)), values
+
+    def user_set(self, row):
+        """Return the contents of the row's user_set, adding them to user_sets."""
+        values = self.get_user_set(row)
+        if len(self.user_set_keys) == 1:
+            user_set = {**_DEFAULT_USER_SET, self.user_set_keys[0]: values}
+        else:
+            user_set = {**_DEFAULT_USER_SET, **dict(zip(self.user_set_keys, values))}
+        try:
+            self.user_sets[self.user_set_key(row)] = user_set
+        except TypeError:
+            # Unhashable values can't be looked up, so they are always built.
+            pass
+        return user_set
+
+
+def _bulk_load(data):
+    """
+    Build the tree described by a decoded serialization. This is the hot path for
+    importing large generated pipelines, so unlike load_node() it bypasses
+    Node.__init__ and Node.__setitem__: nodes are allocated with __new__ and
+    their slots filled directly, all of them share one Repository, rebuilt from the
+    serialized images, and one id generator, and edges are linked in a single pass
+    without the integrity checks and repo merges. The input is trusted to be a
+    tree, as produced by Node.serialize().
+    """
+    classes = {"Exec": Exec, "Serial": Serial, "Parallel": Parallel}
+    rows = data["nodes"]
+    repo = image_mod.Repository()
+    for img in (data.get("images") or {}).values():
+        repo.add(image_mod.Image._from_dict(img))
+    max_id = max(map(operator.itemgetter("id"), rows), default=-1)
+    id_generator = itertools.count(max_id + 1)
+
+    inherit = constants.SameContainer.INHERIT
+    new = object.__new__
+    layouts = {}
+    nodes = {}
+    root = None
+    with_callbacks = []
+    for row in rows:
+        # Rows of one pipeline share a handful of key layouts, so work out how to
+        # read each layout once rather than per row.
+        keys = tuple(row)
+        try:
+            layout = layouts[keys]
+        except KeyError:
+            layout = layouts[keys] = _RowLayout(keys)
+
+        try:
+            cls = classes[row["type"]]
+        except KeyError:
+            raise TypeError("Type {} not a valid node type".format(row["type"]))
+        node = new(cls)
+        if root is None:
+            root = node
+
+        node._name = "/"
+        node.id = node_id = row["id"]
+        node.id_generator = id_generator
+        try:
+            node.user_set = _UserSet(layout.user_sets[layout.user_set_key(row)])
+        except (KeyError, TypeError):
+            node.user_set = _UserSet(layout.user_set(row))
+        if layout.env_keys:
+            node.env = {name: row[key] for name, key in layout.env_keys}
+        else:
+            node.env = {}
+        node._root = node.id_root = root
+        node.token = None
+        node.parent = None
+        node.children = {}
+        node._callbacks = ()
+        if layout.has_extras:
+            get = row.get
+            node.suppress_errors = get("suppress_errors", False)
+            node.same_container = get("same_container", inherit)
+            node.doc = get("doc")
+            node.title = get("title")
+            node.tags = get("tags")
+        else:
+            node.suppress_errors = False
+            node.same_container = inherit
+            node.doc = node.title = node.tags = None
+        if layout.has_file_and_line:
+            node._file = row["file"]
+            node.line = row["line"]
+        else:
+            node._file = row.get("file")
+            node.line = row.get("line")
+        node._repo = repo
+        node._inherited_cache = None
+        node._path_cache = None
+        node._path_index = None
+        node._autorun = None
+        node._sleep_when_done = None
+        if cls is Exec:
+            node.command = row["command"]
+        elif cls is Serial:
+            node.stop_on_error = row.get("stop_on_error", True)
+        nodes[node_id] = node
+        if layout.has_callbacks and row["callbacks"]:
+            with_callbacks.append(row)
+
+    for parent_id, child_id, name in data["edges"]:
+        parent, child = nodes[parent_id], nodes[child_id]
+        if name in parent.children or child.parent is not None:
+            raise TreeError(
+                f"Adding node {name} violates the integrity of the pipeline"
+            )
+        parent.children[name] = child
+        child.parent = parent
+        child._name = name
+
+    for row in with_callbacks:
+        _add_callbacks(nodes[row["id"]], row["callbacks"], nodes)
+
+    root.token = data.get("token")
+    root._autorun = data.get("autorun", False)
+    root._sleep_when_done = data.get("sleep_when_done", False)
+    return root
+
+
+def _add_callbacks(node, callbacks, nodes):
+    # Callback arguments listed in "__node_args__" are serialized as node ids.
+    for event, (cb_name, cb_args) in callbacks:
+        node_args = cb_args.get("__node_args__", [])
+        kwargs = {
+            k: nodes[v] if k in node_args else v
+            for k, v in cb_args.items()
+            if k != "__node_args__"
+        }
+        cb = callback.base(cb_name, **kwargs)
+        node._callbacks += ((event, cb),)
 
 
 class Node:
@@ -105,13 +401,22 @@ class Node:
 
     _CONTEXT_STACK = []
 
-    _NUM_FILE_AND_LINE_CALLS = 0
-    _MAX_FILE_AND_LINE_CALLS = 50000
+    # Bumped on every change to any Node's user_set or to the shape of any tree.
+    # Cached inherited attributes are only valid for the version they were
+    # computed at.
+    _TREE_VERSION = 0
+
+    # Which Nodes record the file and line they were created on. See
+    # Node.set_debug_info_policy().
+    _DEBUG_INFO_POLICY = _configured_debug_info_policy()
+    _DEBUG_INFO_SAMPLE_RATE = _configured_debug_info_sample_rate()
+    _DEBUG_INFO_COUNT = 0
+    _DEBUG_INFO_FILES = set()
 
     if api.Config().get("config", "force_debug_info") or t.Bool(
         os.getenv("CONDUCTO_FORCE_DEBUG_INFO")
     ):
-        _MAX_FILE_AND_LINE_CALLS = 10 ** 20
+        _DEBUG_INFO_POLICY = DebugInfo.ALWAYS
 
     __slots__ = (
         "_name",
@@ -131,9 +436,12 @@ class Node:
         "doc",
         "title",
         "tags",
-        "file",
+        "_file",
         "line",
         "_repo",
+        "_inherited_cache",
+        "_path_cache",
+        "_path_index",
         "_autorun",
         "_sleep_when_done",
     )
@@ -164,20 +472,20 @@ class Node:
         self.parent = None
         self._root = self
         self.children = {}
-        self._callbacks = []
+        # A tuple, so that the many Nodes without callbacks share the empty one.
+        self._callbacks = ()
         self.token = None
 
         assert image_name is None or image is None, "can only specify one image"
 
         self._repo = image_mod.Repository()
+        self._inherited_cache = None
+        self._path_cache = None
+        self._path_index = None
         # store actual values of each attribute
-        self.user_set = {
-            "skip": skip,
-            "cpu": cpu,
-            "gpu": gpu,
-            "mem": mem,
-            "requires_docker": requires_docker,
-        }
+        self.user_set = _UserSet(
+            skip=skip, cpu=cpu, gpu=gpu, mem=mem, requires_docker=requires_docker,
+        )
 
         if image:
             self.image = image
@@ -215,7 +523,7 @@ class Node:
             self.file = file
             self.line = line
         else:
-            self.file, self.line = self._get_file_and_line()
+            self._file, self.line = self._get_file_and_line()
 
     def __enter__(self):
         Node._CONTEXT_STACK.append(self)
@@ -251,17 +559,51 @@ class Node:
            # /foo
            # /foo/bar
         """
-        name = []
-        cur = self
-        while cur:
-            name.append(cur.name)
-            cur = cur.parent
-        return "/".join(name[::-1]).replace("//", "/")
+        # Paths are cached per node along with the root they were computed under.
+        # A node's path only changes when its root is attached to another tree,
+        # which also changes its root, so a cache with the current root is valid.
+        root = self.root
+        cache = self._path_cache
+        if cache is not None and cache[0] is root:
+            return cache[1]
+
+        # Walk up to the nearest ancestor with a valid cached path, then fill in
+        # the paths on the way back down.
+        chain = []
+        path = None
+        node = self
+        while node is not None:
+            cache = node._path_cache
+            if cache is not None and cache[0] is root:
+                path = cache[1]
+                break
+            chain.append(node)
+            node = node.parent
+        for node in reversed(chain):
+            if path is None:
+                path = node.name
+            else:
+                path = (path + "/" + node.name).replace("//", "/")
+            node._path_cache = (root, path)
+        return path
 
     @property
     def name(self):
         return self._name
 
+    @property
+    def file(self):
+        # Node construction only records the code object of the calling frame when
+        # its filename is absolute. Take the filename on first access, normally when
+        # serializing.
+        if isinstance(self._file, types.CodeType):
+            self._file = self._file.co_filename
+        return self._file
+
+    @file.setter
+    def file(self, val):
+        self._file = val
+
     @property
     def repo(self):
         return self.root._repo
@@ -304,9 +646,10 @@ class Node:
 
     @property
     def image(self) -> typing.Optional[image_mod.Image]:
-        if self.image_name is None:
+        image_name = self.image_name
+        if image_name is None:
             return None
-        return self.repo[self.image_name]
+        return self.repo[image_name]
 
     @property
     def image_name(self):
@@ -345,19 +688,19 @@ class Node:
 
     def on_done(self, cback):
         assert isinstance(cback, callback.base)
-        self._callbacks.append((State.DONE, cback))
+        self._callbacks += ((State.DONE, cback),)
 
     def on_error(self, cback):
         assert isinstance(cback, callback.base)
-        self._callbacks.append((State.ERROR, cback))
+        self._callbacks += ((State.ERROR, cback),)
 
     def on_queued(self, cback):
         assert isinstance(cback, callback.base)
-        self._callbacks.append((State.QUEUED, cback))
+        self._callbacks += ((State.QUEUED, cback),)
 
     def on_running(self, cback):
         assert isinstance(cback, callback.base)
-        self._callbacks.append((State.RUNNING, cback))
+        self._callbacks += ((State.RUNNING, cback),)
 
     def _pull(self):
         if self.id is None or self.root != self.id_root:
@@ -376,22 +719,54 @@ class Node:
             path, new = name.rsplit("/", 1)
             self[path][new] = node
             return
-        if name in self.children or node.root == self.root or node.root != node:
+        root = self.root
+        if name in self.children or node is root or node.root is not node:
             raise TreeError(
                 f"Adding node {name} violates the integrity of the pipeline"
             )
         self.children[name] = node
+        Node._TREE_VERSION += 1
 
-        self.repo.merge(node.repo)
+        root._repo.merge(node._repo)
 
         node.parent = self
-        node._root = self.root
+        node._root = root
         node._name = name
 
+        # Keep the root's path index, if it has one, up to date. The attached
+        # node's own index and inherited attributes are dropped since it is no
+        # longer a root.
+        node._path_index = None
+        node._inherited_cache = None
+        index = root._path_index
+        if index is not None:
+            if node.children:
+                for n in node.stream():
+                    index[str(n)] = n
+            else:
+                index[str(node)] = node
+
     def __getitem__(self, item):
-        # Absolute paths start with a '/' and begin at the root
+        # Absolute paths start with a '/' and begin at the root. They are looked up
+        # in the root's index of all paths, built on first use.
         if item.startswith("/"):
-            current = self.root
+            root = self.root
+            index = root._path_index
+            if index is None:
+                index = root._path_index = {str(n): n for n in root.stream()}
+            try:
+                return index[item]
+            except KeyError:
+                pass
+            # Ignore consecutive delimiters: 'a/b//c' == 'a/b/c'
+            path = "/" + "/".join(i for i in item.split("/") if i)
+            try:
+                return index[path]
+            except KeyError:
+                # Fall through to the walk below, which raises a KeyError naming
+                # the first missing segment.
+                pass
+            current = root
         else:
             current = self
         for i in item.split("/"):
@@ -437,77 +812,153 @@ class Node:
             output["command"] = self.command
         return output
 
-    def serialize(self, pretty=False):
-        def validate_env(node):
-            for key, value in node.env.items():
-                if not isinstance(key, str):
-                    raise TypeError(
-                        f"{node} has {type(key).__name__} in env key when str is required"
-                    )
-                if not isinstance(value, str):
-                    raise TypeError(
-                        f"{node} has {type(value).__name__} in env value for {key} when str is required"
-                    )
+    def serialize(self, pretty=False, format=SerializationFormat.JSON):
+        """
+        Return the serialization of this Node and its descendants as a
+        base64-encoded, gzipped string.
+
+        :param pretty: Return a human-readable dump instead, for debugging.
+        :param format: :py:class:`SerializationFormat`. `JSON` (default) stores
+            one dict per node. `COLUMNAR` stores one array per attribute with
+            interned strings, which is far smaller for large pipelines.
+            :py:func:`deserialize` accepts either.
+        """
+        if pretty:
+            import pprint
 
-        res = {
-            "edges": [],
-            "nodes": [],
-            "images": self.repo.images,
-            "token": self.token,
-            "autorun": self._autorun,
-            "sleep_when_done": self._sleep_when_done,
-        }
-        queue = collections.deque([self])
-        while queue:
-            node = queue.popleft()
-            validate_env(node)
-            node._pull()
-            res["nodes"].append(
-                {k: v for k, v in node.describe().items() if v is not None}
-            )
+            self._prepare_serialization()
+            res = {
+                "edges": [
+                    [node, child, name]
+                    for node in self._bfs()
+                    for name, child in node.children.items()
+                ],
+                "nodes": [node._describe_for_serialization() for node in self._bfs()],
+                "images": self.repo.images,
+                "token": self.token,
+                "autorun": self._autorun,
+                "sleep_when_done": self._sleep_when_done,
+            }
+            return pprint.pformat(res)
+
+        buf = io.StringIO()
+        self.serialize_to(buf, format=format)
+        return buf.getvalue()
 
+    def serialize_to(
+        self,
+        fileobj,
+        chunk_size=2 ** 16,
+        format=SerializationFormat.JSON,
+        binary: bool = None,
+    ):
+        """
+        Write the serialization of this Node to `fileobj`, producing the same
+        base64-encoded, gzipped JSON as :py:func:`serialize` without ever holding
+        the whole pipeline in memory. JSON fragments are generated node by node
+        and fed through an incremental compressor, so peak memory stays flat as
+        the pipeline grows.
+
+        :param fileobj: Writable file-like object.
+        :param chunk_size: Approximate number of characters of JSON to buffer
+            before handing them to the compressor.
+        :param format: :py:class:`SerializationFormat`, see :py:func:`serialize`.
+            The columnar format is built in memory before it is written out.
+        :param binary: Whether `fileobj` takes `bytes` rather than `str`. By default,
+            text streams, meaning :py:class:`io.TextIOBase` objects and wrappers
+            with a `buffer` attribute like `sys.stdout`, receive `str`, and
+            anything else (binary files, `socket.makefile("wb")`) receives `bytes`.
+        """
+        if binary is None:
+            binary = not (
+                isinstance(fileobj, io.TextIOBase) or hasattr(fileobj, "buffer")
+            )
+        if format == SerializationFormat.JSON:
+            fragments = self._serialization_fragments()
+        elif format == SerializationFormat.COLUMNAR:
+            fragments = _NodeEncoder().iterencode(_to_columnar(self))
+        else:
+            raise ValueError(f"Unknown serialization format: {repr(format)}")
+
+        writer = _Base64Writer(fileobj, binary)
+        with gzip.GzipFile(fileobj=writer, mode="wb", compresslevel=3) as gz:
+            pending, pending_size = [], 0
+            for fragment in fragments:
+                pending.append(fragment)
+                pending_size += len(fragment)
+                if pending_size >= chunk_size:
+                    gz.write("".join(pending).encode())
+                    pending, pending_size = [], 0
+            if pending:
+                gz.write("".join(pending).encode())
+        writer.close()
+
+    def _serialization_fragments(self):
+        # Emits exactly the text that json.dumps() would produce for the
+        # {"edges", "nodes", "images", ...} dict, one small piece at a time. Edges
+        # refer to node ids, so all ids are assigned in a first pass.
+        self._prepare_serialization()
+        encoder = _NodeEncoder()
+
+        yield '{"edges": ['
+        sep = ""
+        for node in self._bfs():
             for name, child in node.children.items():
-                queue.append(child)
-                res["edges"].append([node, child, name])
+                yield sep + encoder.encode([node, child, name])
+                sep = ", "
+
+        yield '], "nodes": ['
+        sep = ""
+        for node in self._bfs():
+            yield sep + encoder.encode(node._describe_for_serialization())
+            sep = ", "
+
+        yield '], "images": ' + encoder.encode(self.repo.images)
+        yield ', "token": ' + encoder.encode(self.token)
+        yield ', "autorun": ' + encoder.encode(self._autorun)
+        yield ', "sleep_when_done": ' + encoder.encode(self._sleep_when_done)
+        yield "}"
+
+    def _prepare_serialization(self):
+        for node in self._bfs():
+            node._validate_env()
+            node._pull()
 
-        class NodeEncoder(json.JSONEncoder):
-            def default(self, o):
-                try:
-                    return o._id
-                except AttributeError:
-                    return o
+    def _validate_env(self):
+        for key, value in self.env.items():
+            if not isinstance(key, str):
+                raise TypeError(
+                    f"{self} has {type(key).__name__} in env key when str is required"
+                )
+            if not isinstance(value, str):
+                raise TypeError(
+                    f"{self} has {type(value).__name__} in env value for {key} when str is required"
+                )
 
-        if pretty:
-            import pprint
+    def _describe_for_serialization(self):
+        return {k: v for k, v in self.describe().items() if v is not None}
 
-            return pprint.pformat(res)
-        output = json.dumps(res, cls=NodeEncoder)
-        return base64.b64encode(
-            gzip.compress(output.encode(), compresslevel=3)
-        ).decode()
+    def _bfs(self):
+        # Serialization order. Node ids are handed out in this order, so it must
+        # stay breadth-first to keep serializations stable.
+        queue = collections.deque([self])
+        while queue:
+            node = queue.popleft()
+            yield node
+            queue.extend(node.children.values())
 
     @staticmethod
     def deserialize(string):
         string = gzip.decompress(base64.b64decode(string))
-        data = json.loads(string)
-        nodes = {i["id"]: load_node(**i) for i in data["nodes"]}
-
-        for i in data["nodes"]:
-            for event, cb_literal in i.get("callbacks", []):
-                cb, cb_args = cb_literal
-                kwargs = {
-                    k: nodes[cb_args[k]] for k in cb_args.get("__node_args__", [])
-                }
-                cb = callback.base(cb, **kwargs)
-                nodes[i["id"]]._callbacks.append((event, cb))
-
-        for parent, child, name in data["edges"]:
-            nodes[parent][name] = nodes[child]
-
-        root = nodes[data["nodes"][0]["id"]]
-        root.token = data.get("token")
-        root._autorun = data.get("autorun", False)
-        root._sleep_when_done = data.get("sleep_when_done", False)
+        with _gc_paused():
+            data = json.loads(string)
+            if data.get("format") == SerializationFormat.COLUMNAR:
+                root = _bulk_load_columnar(data)
+            else:
+                root = _bulk_load(data)
+            # Free the decoded JSON while the collector is still paused, so that it
+            # doesn't get scanned when the collector resumes.
+            del data
         return root
 
     # returns a stream in topological order
@@ -538,15 +989,75 @@ class Node:
             return _fwd()
 
     def get_inherited_attribute(self, attr):
+        """
+        Return `attr` as set on this Node or, if it is unset, on its nearest
+        ancestor that sets it. Once enough lookups follow each other without any
+        change to a tree, each attribute is resolved for the whole tree in one pass
+        and looked up in O(1) until the next change.
+        """
+        root = self.root
+        cache = root._inherited_cache
+        if cache is None:
+            cache = root._inherited_cache = _InheritedCache()
+        if cache.version != Node._TREE_VERSION:
+            cache.reset(Node._TREE_VERSION)
+
+        try:
+            table = cache.tables[attr]
+        except KeyError:
+            if cache.walks < cache.walk_limit():
+                # Resolving the whole tree only pays off if enough lookups follow
+                # before the next change, so walk the parents until then.
+                cache.walks += 1
+                return self._walk_inherited_attribute(attr)
+            table = cache.tables[attr] = root._resolve_inherited_attribute(attr)
+            cache.size = len(table)
+        return table[id(self)]
+
+    @contextlib.contextmanager
+    def _bulk_inherited_attributes(self):
+        """
+        For code that reads inherited attributes on many nodes of the tree: inside
+        this block each attribute is resolved for the whole tree on its first
+        lookup, or on the second after a change made inside the block, instead of
+        after a number of lookups that walk the parents.
+        """
+        root = self.root
+        cache = root._inherited_cache
+        if cache is None:
+            cache = root._inherited_cache = _InheritedCache()
+        if cache.bulk:
+            # Already inside an enclosing block.
+            yield
+            return
+        cache.bulk = True
+        cache.bulk_version = Node._TREE_VERSION
+        try:
+            yield
+        finally:
+            cache.bulk = False
+
+    def _walk_inherited_attribute(self, attr):
         node = self
         while node is not None:
-            v = node.user_set[attr]
+            v = node.user_set.get(attr)
             if v is not None:
                 return v
             else:
                 node = node.parent
         return None
 
+    def _resolve_inherited_attribute(self, attr):
+        # stream() yields parents before their children, so one top-down pass
+        # resolves every node.
+        table = {}
+        for node in self.stream():
+            v = node.user_set.get(attr)
+            if v is None and node is not self:
+                v = table[id(node.parent)]
+            table[id(node)] = v
+        return table
+
     def launch_local(
         self,
         use_shell=True,
@@ -600,6 +1111,9 @@ class Node:
             self.image = image_mod.Image(name="conducto-default")
 
         self.check_images()
+        # Hash the images' files here, where they are, so that the hashes and the
+        # names that come from them are serialized with the pipeline.
+        image_mod.compute_content_hashes(self)
 
         if build_mode != constants.BuildMode.LOCAL or prebuild_images:
             image_mod.make_all(
@@ -621,13 +1135,15 @@ class Node:
         )
 
     def check_images(self):
-        for node in self.stream():
-            if isinstance(node, Exec):
-                node.expanded_command()
+        with self._bulk_inherited_attributes():
+            for node in self.stream():
+                if isinstance(node, Exec):
+                    node.expanded_command()
 
     def pretty(self, strict=True):
         buf = []
-        self._pretty("", "", "", buf, strict)
+        with self._bulk_inherited_attributes():
+            self._pretty("", "", "", buf, strict)
         return "\n".join(buf)
 
     def _pretty(self, node_prefix, child_prefix, index_str, buf, strict):
@@ -681,25 +1197,67 @@ class Node:
 
     @staticmethod
     def _get_file_and_line():
-        if Node._NUM_FILE_AND_LINE_CALLS > Node._MAX_FILE_AND_LINE_CALLS:
+        # Returns the code object and line number of the first frame outside of
+        # Conducto; the filename is only taken from it later, in Node.file.
+        policy = Node._DEBUG_INFO_POLICY
+        if policy == DebugInfo.NEVER:
+            return None, None
+        if policy == DebugInfo.SAMPLED:
+            # Always record the first Node, then one in every sample_rate.
+            Node._DEBUG_INFO_COUNT += 1
+            if (Node._DEBUG_INFO_COUNT - 1) % Node._DEBUG_INFO_SAMPLE_RATE:
+                return None, None
+
+        frame = sys._getframe(1)
+        while frame is not None:
+            code = frame.f_code
+            if not code.co_filename.startswith(_conducto_dir):
+                break
+            frame = frame.f_back
+        else:
             return None, None
-        Node._NUM_FILE_AND_LINE_CALLS += 1
 
-        for frame, lineno in traceback.walk_stack(None):
-            filename = frame.f_code.co_filename
-            if not filename.startswith(_conducto_dir):
-                if not _isabs(filename):
-                    filename = _abspath(filename)
-                return filename, lineno
+        if policy == DebugInfo.PER_FILE:
+            if code.co_filename in Node._DEBUG_INFO_FILES:
+                return None, None
+            Node._DEBUG_INFO_FILES.add(code.co_filename)
 
-        return None, None
+        if not _isabs(code.co_filename):
+            # Resolve it now, before the current directory can change again.
+            return os.path.abspath(code.co_filename), frame.f_lineno
+        return code, frame.f_lineno
+
+    @staticmethod
+    def set_debug_info_policy(policy, sample_rate=None):
+        """
+        Choose which Nodes record the file and line they were created on, shown
+        as debug info in the app.
+
+        :param policy: A :py:class:`DebugInfo` value. `ALWAYS` (default) records
+            it for every Node, `SAMPLED` for one in every `sample_rate` Nodes,
+            `PER_FILE` for the first Node created from each file, and `NEVER`
+            for none.
+        :param sample_rate: For `SAMPLED`, record one in this many Nodes.
+
+        The policy can also be set with the `CONDUCTO_DEBUG_INFO` and
+        `CONDUCTO_DEBUG_INFO_SAMPLE_RATE` environment variables or the
+        `debug_info` and `debug_info_sample_rate` options in the `[config]`
+        section of the Conducto config.
+        """
+        if policy not in DebugInfo.all:
+            raise ValueError(f"Unknown debug info policy: {repr(policy)}")
+        Node._DEBUG_INFO_POLICY = policy
+        if sample_rate is not None:
+            if sample_rate < 1:
+                raise ValueError(f"sample_rate must be >= 1, got {sample_rate}")
+            Node._DEBUG_INFO_SAMPLE_RATE = sample_rate
 
     @staticmethod
     def force_debug_info(val):
         if val:
-            Node._MAX_FILE_AND_LINE_CALLS = 10 ** 30
+            Node._DEBUG_INFO_POLICY = DebugInfo.ALWAYS
         else:
-            Node._MAX_FILE_AND_LINE_CALLS = 10 ** 4
+            Node._DEBUG_INFO_POLICY = DebugInfo.SAMPLED
 
 
 class Exec(Node):
@@ -887,7 +1445,10 @@ class Serial(Node):
         image: typing.Union[str, image_mod.Image] = None,
         image_name=None,
         doc=None,
+        title=None,
         tags: typing.Iterable = None,
+        file=None,
+        line=None,
     ):
         super().__init__(
             env=env,
@@ -902,11 +1463,377 @@ class Serial(Node):
             image=image,
             image_name=image_name,
             doc=doc,
+            title=title,
             tags=tags,
+            file=file,
+            line=line,
         )
         self.stop_on_error = stop_on_error
 
 
-_abspath = functools.lru_cache(1000)(os.path.abspath)
+_COLUMNAR_VERSION = 1
+
+
+def _to_columnar(root):
+    """
+    Convert the tree under `root` into the columnar layout. Nodes are numbered in
+    serialization order; the tree shape is stored as an array of parent indices
+    plus child names, and every key of Node.describe() becomes its own column.
+    Columns only hold values for nodes that set them, with a bitmap recording
+    which nodes those are (omitted if every node sets it). Columns of strings
+    (file paths, image names, commands, env values, ...) are interned into a
+    per-column string table. Integer arrays are delta-encoded and string tables
+    front-coded so that gzip can squeeze out the regularity between neighbors.
+    """
+    root._prepare_serialization()
+
+    positions = {}
+    ids, parents, names = [], [], []
+    columns = {}
+    for i, node in enumerate(root._bfs()):
+        positions[id(node)] = i
+        ids.append(node.id)
+        if i:
+            parents.append(positions[id(node.parent)])
+            names.append(node.name)
+        for key, value in node._describe_for_serialization().items():
+            if key == "id":
+                continue
+            try:
+                column = columns[key]
+            except KeyError:
+                column = columns[key] = ([], [])
+            column[0].append(i)
+            column[1].append(value)
+
+    count = len(ids)
+    encoded_columns = {}
+    for key, (indices, values) in columns.items():
+        encoded = {
+            "set": None if len(indices) == count else _encode_bitmap(indices, count)
+        }
+        if all(isinstance(v, str) for v in values):
+            table = {}
+            interned = [table.setdefault(v, len(table)) for v in values]
+            encoded["strings"] = _front_encode(list(table))
+            encoded["values"] = _delta_encode(interned)
+        else:
+            encoded["values"] = values
+        encoded_columns[key] = encoded
+
+    return {
+        "format": SerializationFormat.COLUMNAR,
+        "version": _COLUMNAR_VERSION,
+        "count": count,
+        "ids": None if ids == list(range(count)) else _delta_encode(ids),
+        "parents": _delta_encode(parents),
+        "names": _front_encode(names),
+        "columns": encoded_columns,
+        "images": root.repo.images,
+        "token": root.token,
+        "autorun": root._autorun,
+        "sleep_when_done": root._sleep_when_done,
+    }
+
+
+# Columns of the columnar layout that are stored in a Node attribute, rather than
+# in user_set or env, and the attribute for each.
+_COLUMNAR_ATTRS = {
+    "file": "_file",
+    "line": "line",
+    "doc": "doc",
+    "title": "title",
+    "tags": "tags",
+    "same_container": "same_container",
+    "suppress_errors": "suppress_errors",
+    "stop_on_error": "stop_on_error",
+    "command": "command",
+}
+
+
+def _bulk_load_columnar(data):
+    """
+    Build the tree described by a decoded columnar serialization. Like
+    _bulk_load(), nodes are allocated with __new__ and their slots filled
+    directly, but attributes are filled in a column at a time, without
+    expanding the columns into a dict per node first.
+    """
+    if data.get("version") != _COLUMNAR_VERSION:
+        raise ValueError(
+            f"Unsupported columnar serialization version: {data.get('version')}"
+        )
+    count = data["count"]
+    if data["ids"] is None:
+        ids = range(count)
+    else:
+        ids = _delta_decode(data["ids"])
+    columns = data["columns"]
+    repo = image_mod.Repository()
+    for img in (data.get("images") or {}).values():
+        repo.add(image_mod.Image._from_dict(img))
+    id_generator = itertools.count(max(ids, default=-1) + 1)
+
+    # Every node has a type, so the column holds a value for each of them.
+    classes = {"Exec": Exec, "Serial": Serial, "Parallel": Parallel}
+    new = object.__new__
+    nodes = []
+    for node_type in _column_values(columns["type"]):
+        try:
+            nodes.append(new(classes[node_type]))
+        except KeyError:
+            raise TypeError("Type {} not a valid node type".format(node_type))
+    root = nodes[0]
+
+    inherit = constants.SameContainer.INHERIT
+    for node, node_id in zip(nodes, ids):
+        node._name = "/"
+        node.id = node_id
+        node.id_generator = id_generator
+        node.user_set = _UserSet(_DEFAULT_USER_SET)
+        node.env = {}
+        node._root = node.id_root = root
+        node.token = None
+        node.parent = None
+        node.children = {}
+        node._callbacks = ()
+        node.suppress_errors = False
+        node.same_container = inherit
+        node.doc = node.title = node.tags = None
+        node._file = node.line = None
+        node._repo = repo
+        node._inherited_cache = None
+        node._path_cache = None
+        node._path_index = None
+        node._autorun = None
+        node._sleep_when_done = None
+        cls = node.__class__
+        if cls is Exec:
+            node.command = None
+        elif cls is Serial:
+            node.stop_on_error = True
+
+    # Filling in user_set with dict.__setitem__ skips bumping Node._TREE_VERSION,
+    # which is pointless for nodes that nothing has cached anything about yet.
+    set_item = dict.__setitem__
+    with_callbacks = ()
+    for key, column in columns.items():
+        if key == "type":
+            continue
+        values = _column_values(column)
+        if column["set"] is None:
+            indices = range(count)
+        else:
+            indices = _decode_bitmap(column["set"])
+        if key == "callbacks":
+            with_callbacks = [(nodes[i], cbs) for i, cbs in zip(indices, values) if cbs]
+        elif key in _COLUMNAR_ATTRS:
+            attr = _COLUMNAR_ATTRS[key]
+            for i, value in zip(indices, values):
+                setattr(nodes[i], attr, value)
+        elif key.startswith("__env__"):
+            name = key[len("__env__") :]
+            for i, value in zip(indices, values):
+                nodes[i].env[name] = value
+        else:
+            for i, value in zip(indices, values):
+                set_item(nodes[i].user_set, key, value)
+
+    parents = _delta_decode(data["parents"])
+    names = _front_decode(data["names"])
+    for child, parent_index, name in zip(
+        itertools.islice(nodes, 1, None), parents, names
+    ):
+        parent = nodes[parent_index]
+        if name in parent.children:
+            raise TreeError(
+                f"Adding node {name} violates the integrity of the pipeline"
+            )
+        parent.children[name] = child
+        child.parent = parent
+        child._name = name
+
+    if with_callbacks:
+        nodes_by_id = dict(zip(ids, nodes))
+        for node, callbacks in with_callbacks:
+            _add_callbacks(node, callbacks, nodes_by_id)
+
+    root.token = data.get("token")
+    root._autorun = data.get("autorun", False)
+    root._sleep_when_done = data.get("sleep_when_done", False)
+    return root
+
+
+def _column_values(column):
+    values = column["values"]
+    if "strings" in column:
+        table = _front_decode(column["strings"])
+        values = [table[v] for v in _delta_decode(values)]
+    return values
+
+
+def _delta_encode(ints):
+    return [b - a for a, b in zip([0] + ints, ints)]
+
+
+def _delta_decode(deltas):
+    return list(itertools.accumulate(deltas))
+
+
+def _front_encode(strings):
+    # Store each string as the length of the prefix it shares with its
+    # predecessor plus the remaining suffix.
+    prefixes, suffixes = [], []
+    prev = ""
+    for s in strings:
+        n = len(os.path.commonprefix([prev, s]))
+        prefixes.append(n)
+        suffixes.append(s[n:])
+        prev = s
+    return [prefixes, suffixes]
+
+
+def _front_decode(encoded):
+    out = []
+    prev = ""
+    for n, suffix in zip(*encoded):
+        prev = prev[:n] + suffix
+        out.append(prev)
+    return out
+
+
+def _encode_bitmap(indices, count):
+    bitmap = bytearray((count + 7) // 8)
+    for i in indices:
+        bitmap[i >> 3] |= 1 << (i & 7)
+    return base64.b64encode(bitmap).decode()
+
+
+def _decode_bitmap(text):
+    for byte_index, byte in enumerate(base64.b64decode(text)):
+        # Skip empty bytes quickly; most columns are sparse.
+        if byte:
+            base = byte_index << 3
+            for bit in range(8):
+                if byte >> bit & 1:
+                    yield base + bit
+
+
+class _InheritedCache:
+    """
+    Inherited attributes of every node of a tree, resolved for Node._TREE_VERSION
+    `version` and kept on the root of the tree. `tables` maps an attribute to a
+    dict from id(node) to its value.
+    """
+
+    __slots__ = ("version", "tables", "walks", "size", "bulk", "bulk_version")
+
+    # Lookups that walk the parents, with no change to any tree in between, before
+    # the whole tree is resolved. At least this many, and otherwise a fraction of
+    # the size of the tree, so that resolving it costs O(1) per lookup.
+    MIN_WALKS = 64
+    WALKS_PER_NODE = 0.25
+
+    def __init__(self):
+        self.version = None
+        self.tables = {}
+        self.walks = 0
+        # The number of nodes the last resolved table had.
+        self.size = 0
+        self.bulk = False
+        # Node._TREE_VERSION when the enclosing bulk block began.
+        self.bulk_version = None
+
+    def reset(self, version):
+        self.version = version
+        self.tables = {}
+        self.walks = 0
+
+    def walk_limit(self):
+        if self.bulk:
+            # After a change inside the block, still walk for the first lookup, in
+            # case the block changes the tree between every lookup.
+            return 0 if self.version == self.bulk_version else 1
+        return max(self.MIN_WALKS, int(self.size * self.WALKS_PER_NODE))
+
+
+class _UserSet(dict):
+    """
+    The dict behind Node.user_set. Every modification bumps Node._TREE_VERSION
+    so that cached inherited attributes get recomputed.
+    """
+
+    __slots__ = ()
+
+    def __setitem__(self, key, value):
+        Node._TREE_VERSION += 1
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        Node._TREE_VERSION += 1
+        super().__delitem__(key)
+
+    def update(self, *args, **kwargs):
+        Node._TREE_VERSION += 1
+        super().update(*args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        Node._TREE_VERSION += 1
+        return super().setdefault(key, default)
+
+    def pop(self, *args):
+        Node._TREE_VERSION += 1
+        return super().pop(*args)
+
+    def popitem(self):
+        Node._TREE_VERSION += 1
+        return super().popitem()
+
+    def clear(self):
+        Node._TREE_VERSION += 1
+        super().clear()
+
+
+class _NodeEncoder(json.JSONEncoder):
+    def default(self, o):
+        try:
+            return o._id
+        except AttributeError:
+            return o
+
+
+class _Base64Writer:
+    """
+    Minimal binary file-like object that base64-encodes everything written to it
+    and passes the result on to `fileobj`. Leftover bytes that don't fill a whole
+    3-byte group are held back until more data arrives or `close()` is called, so
+    the concatenated output equals base64 of the concatenated input.
+    """
+
+    def __init__(self, fileobj, binary):
+        self.fileobj = fileobj
+        self.binary = binary
+        self.remainder = b""
+
+    def write(self, data):
+        size = len(data)
+        data = self.remainder + bytes(data)
+        cutoff = len(data) - len(data) % 3
+        self.remainder = data[cutoff:]
+        if cutoff:
+            self._emit(base64.b64encode(data[:cutoff]))
+        return size
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.remainder:
+            self._emit(base64.b64encode(self.remainder))
+            self.remainder = b""
+
+    def _emit(self, encoded):
+        self.fileobj.write(encoded if self.binary else encoded.decode())
+
+
 _isabs = functools.lru_cache(1000)(os.path.isabs)
 _conducto_dir = os.path.dirname(__file__) + os.path.sep
@@ -0,0 +1,53 @@
+import contextlib
+import os
+import tempfile
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode="wb", perms=None):
+    """
+    Yield a temp file opened with `mode` next to `path`, and move it to `path` once
+    the block finishes, so readers never see a partial file. If the block raises,
+    the temp file is deleted and `path` is left alone. The file gets permissions
+    `perms`, or is readable only by the user if it is None.
+    """
+    dirpath = os.path.dirname(os.path.abspath(path))
+    os.makedirs(dirpath, exist_ok=True)
+    fd, tmppath = tempfile.mkstemp(dir=dirpath, suffix=".tmp")
+    try:
+        with open(fd, mode) as f:
+            yield f
+        if perms is not None:
+            os.chmod(tmppath, perms)
+        os.replace(tmppath, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmppath)
+        raise
+
+
+def evict_lru(dirname, max_bytes):
+    """
+    Remove the least recently modified files in `dirname` until the rest total at
+    most `max_bytes`. Temp files from atomic_write() and `.lock` files are left
+    alone. Caches touch their files when they are read, so that this removes the
+    least recently used ones.
+    """
+    files = []
+    try:
+        with os.scandir(dirname) as it:
+            for de in it:
+                if de.name.endswith((".tmp", ".lock")):
+                    continue
+                with contextlib.suppress(FileNotFoundError):
+                    st = de.stat()
+                    files.append((st.st_mtime, st.st_size, de.path))
+    except FileNotFoundError:
+        return
+    total = sum(size for _mtime, size, _path in files)
+    for _mtime, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        with contextlib.suppress(OSError):
+            os.remove(path)
+        total -= size
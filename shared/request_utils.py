@@ -1,6 +1,11 @@
+import collections
 import http
+import http.client
+import io
 import json
+import os
 import re
+import threading
 import urllib
 import urllib.request
 from urllib.parse import urlparse
@@ -41,71 +46,257 @@ def parse(url):
     return urlparse(url)
 
 
-def get(url, headers=None, params=None):
+class _ConnectionPool:
+    """
+    Keep-alive connections, so that repeated requests to the same host don't each
+    pay for a new TCP and TLS handshake. A connection is used by one thread at a
+    time, and at most `maxsize` idle connections are kept per host.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._idle = collections.defaultdict(list)
+        self._pid = os.getpid()
+        self._ssl_context = None
+
+    def acquire(self, scheme, netloc):
+        """Return `(conn, reused)` for the host, reusing an idle connection if any."""
+        with self._lock:
+            # Connections inherited from a parent process can't be shared with it.
+            if self._pid != os.getpid():
+                self._idle.clear()
+                self._pid = os.getpid()
+            idle = self._idle[scheme, netloc]
+            while idle:
+                conn = idle.pop()
+                if not _is_connection_dropped(conn):
+                    return conn, True
+                conn.close()
+            if scheme == "https" and self._ssl_context is None:
+                import ssl
+
+                self._ssl_context = ssl.create_default_context()
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(netloc, context=self._ssl_context)
+        else:
+            conn = http.client.HTTPConnection(netloc)
+        return conn, False
+
+    def release(self, scheme, netloc, conn):
+        with self._lock:
+            idle = self._idle[scheme, netloc]
+            if self._pid == os.getpid() and len(idle) < self.maxsize:
+                idle.append(conn)
+                return
+        conn.close()
+
+
+def _is_connection_dropped(conn):
+    """
+    An idle keep-alive connection has nothing to read, so if its socket is readable
+    the server has closed it (or sent something unexpected) and it can't be reused.
+    """
+    import select
+
+    if conn.sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([conn.sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
+_pool = _ConnectionPool(maxsize=10)
+
+# Errors from sending on a keep-alive connection that the server already closed.
+_STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    ConnectionResetError,
+    BrokenPipeError,
+)
+# Once the request has been sent, the server may have acted on it before closing the
+# connection, so only these are sent again after one of those errors. A request that
+# failed while it was being sent is sent again whatever its method.
+_IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE")
+
+
+class _Response:
+    """
+    A fully read response, with the parts of the urlopen() response interface
+    that callers use. Reading the body up front lets the connection go back to the
+    pool right away.
+    """
+
+    def __init__(self, url, resp, body):
+        self.url = url
+        self.status = resp.status
+        self.reason = resp.reason
+        self.headers = self.msg = resp.headers
+        self._body = io.BytesIO(body)
+
+    def read(self, amt=None):
+        return self._body.read(amt)
+
+    def getcode(self):
+        return self.status
+
+    def geturl(self):
+        return self.url
+
+    def info(self):
+        return self.headers
+
+    def getheader(self, name, default=None):
+        return self.headers.get(name, default)
+
+    def close(self):
+        self._body.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _request(method, url, headers, data=None, decode_gzip=True, redirects=10):
+    parts = urlparse(url)
+    if parts.scheme not in ("http", "https") or _uses_proxy(parts):
+        return _urlopen(method, url, headers, data)
+
+    headers = dict(headers)
+    lower = {k.lower() for k in headers}
+    # Same defaults that urllib.request adds.
+    if "user-agent" not in lower:
+        headers["User-Agent"] = f"Python-urllib/{urllib.request.__version__}"
+    if data is not None and "content-type" not in lower:
+        headers["Content-Type"] = "application/x-www-form-urlencoded"
+    if decode_gzip and "accept-encoding" not in lower:
+        headers["Accept-Encoding"] = "gzip"
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+
+    while True:
+        conn, reused = _pool.acquire(parts.scheme, parts.netloc)
+        sent = False
+        try:
+            conn.request(method, path, body=data, headers=headers)
+            sent = True
+            resp = conn.getresponse()
+            body = resp.read()
+        except _STALE_ERRORS as e:
+            conn.close()
+            if reused and (not sent or method in _IDEMPOTENT_METHODS):
+                # Try again on a new connection.
+                continue
+            raise urllib.error.URLError(e)
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            raise urllib.error.URLError(e)
+        except BaseException:
+            conn.close()
+            raise
+        break
+
+    if resp.will_close:
+        conn.close()
+    else:
+        _pool.release(parts.scheme, parts.netloc, conn)
+
+    if decode_gzip and resp.headers.get("content-encoding", "").lower() == "gzip":
+        import gzip
+
+        body = gzip.decompress(body)
+        del resp.headers["content-encoding"]
+        del resp.headers["content-length"]
+        resp.headers["Content-Length"] = str(len(body))
+
+    # Follow redirects like urlopen() did: any of them for safe methods, and 301, 302
+    # and 303 for POST, which it turned into a GET without the body.
+    if (resp.status in (301, 302, 303, 307, 308) and method in ("GET", "HEAD")) or (
+        resp.status in (301, 302, 303) and method == "POST"
+    ):
+        location = resp.headers.get("location")
+        if location and redirects > 0:
+            if method == "POST":
+                method = "GET"
+                headers = {
+                    k: v
+                    for k, v in headers.items()
+                    if k.lower() not in ("content-type", "content-length")
+                }
+            return _request(
+                method,
+                urllib.parse.urljoin(url, location),
+                headers,
+                decode_gzip=decode_gzip,
+                redirects=redirects - 1,
+            )
+    return _Response(url, resp, body)
+
+
+def _uses_proxy(parts):
+    # http.client doesn't speak to proxies, so leave those requests to urllib.
+    proxies = urllib.request.getproxies()
+    return parts.scheme in proxies and not urllib.request.proxy_bypass(
+        parts.hostname or ""
+    )
+
+
+def _urlopen(method, url, headers, data=None):
+    the_request = urllib.request.Request(url, headers=headers, data=data, method=method)
+    try:
+        return urllib.request.urlopen(the_request)
+    except urllib.error.HTTPError as e:
+        return e
+
+
+def get(url, headers=None, params=None, decode_gzip=True):
     if headers is None:
         headers = {}
     url = _put_params(url, params)
-    the_request = urllib.request.Request(url, headers=headers, method="GET")
-    try:
-        response = urllib.request.urlopen(the_request)
-    except urllib.error.HTTPError as e:
-        response = e
+    response = _request("GET", url, headers, decode_gzip=decode_gzip)
     _add_status_code(response)
     return response
 
 
-def put(url, headers=None, data=None):
+def put(url, headers=None, data=None, decode_gzip=True):
     if headers is None:
         headers = {}
     data = _get_json_bytes(data)
     assert isinstance(data, bytes), f"data is of type {type(data)}."
-    the_request = urllib.request.Request(url, headers=headers, data=data, method="PUT")
-    try:
-        response = urllib.request.urlopen(the_request)
-    except urllib.error.HTTPError as e:
-        response = e
+    response = _request("PUT", url, headers, data, decode_gzip=decode_gzip)
     _add_status_code(response)
     return response
 
 
-def post(url, headers=None, data=None):
+def post(url, headers=None, data=None, decode_gzip=True):
     if headers is None:
         headers = {}
     data = _get_json_bytes(data)
     assert isinstance(data, bytes), f"data is of type {type(data)}."
-    the_request = urllib.request.Request(url, headers=headers, data=data, method="POST")
-    try:
-        response = urllib.request.urlopen(the_request)
-    except urllib.error.HTTPError as e:
-        response = e
+    response = _request("POST", url, headers, data, decode_gzip=decode_gzip)
     _add_status_code(response)
     return response
 
 
-def delete(url, headers=None, params=None):
+def delete(url, headers=None, params=None, decode_gzip=True):
     if headers is None:
         headers = {}
     url = _put_params(url, params)
-    the_request = urllib.request.Request(url, headers=headers, method="DELETE")
-    try:
-        response = urllib.request.urlopen(the_request)
-    except urllib.error.HTTPError as e:
-        response = e
+    response = _request("DELETE", url, headers, decode_gzip=decode_gzip)
     _add_status_code(response)
     return response
 
 
-def patch(url, headers=None, data=None):
+def patch(url, headers=None, data=None, decode_gzip=True):
     if headers is None:
         headers = {}
     data = _get_json_bytes(data)
     assert isinstance(data, bytes), f"data is of type {type(data)}."
-    the_request = urllib.request.Request(
-        url, headers=headers, data=data, method="PATCH"
-    )
-    try:
-        response = urllib.request.urlopen(the_request)
-    except urllib.error.HTTPError as e:
-        response = e
+    response = _request("PATCH", url, headers, data, decode_gzip=decode_gzip)
     _add_status_code(response)
     return response
@@ -1,5 +1,4 @@
 import typing, datetime, collections, inspect, re
-from dateutil import parser
 
 Token = typing.NewType("Token", str)
 Tag = typing.NewType("Tag", str)
@@ -126,6 +125,13 @@ class Bool(int):  # we cannot subclass `bool`, use next-best option
         return Bool(s)
 
 
+def _parse_datetime(s):
+    # dateutil is slow to import, and most processes never parse a date.
+    from dateutil import parser
+
+    return parser.parse(s)
+
+
 class Datetime_Date(datetime.date):
     def __new__(cls, date_str):
         assert isinstance(date_str, str), "input is not a string: {} - {}".format(
@@ -135,7 +141,7 @@ class Datetime_Date(datetime.date):
         #   - '2019-03-11'
         #   - '20190311'
         #   - 'march 11, 2019'
-        dt = parser.parse(date_str)
+        dt = _parse_datetime(date_str)
         if dt.time() != datetime.datetime.min.time():
             raise ValueError(
                 "Interpreting input as a date, but got non-zero "
@@ -157,7 +163,7 @@ class Datetime_Time(datetime.time):
         #   - '2019-03-11'
         #   - '20190311'
         #   - 'march 11, 2019'
-        tm = parser.parse(time_str)
+        tm = _parse_datetime(time_str)
         if tm.date() != datetime.datetime.now().date():
             raise ValueError(
                 "Interpreting input as a time, but got non-zero "
@@ -175,7 +181,7 @@ class Datetime_Datetime(datetime.datetime):
         assert isinstance(datetime_str, str), "input is not a string: {} - {}".format(
             datetime_str, type(datetime_str)
         )
-        return parser.parse(datetime_str)
+        return _parse_datetime(datetime_str)
 
     @staticmethod
     def from_str(s):